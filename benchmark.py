@@ -0,0 +1,416 @@
+# benchmark.py: Medição do desempenho das procuras de takuzu.py.
+#
+# Corre cada procura, com cada política de ramificação e heurística
+# pedidas, sobre as instâncias tests/input_T* e regista, para cada
+# execução, o tempo, os nós expandidos, os testes objetivo, a memória
+# máxima e se a solução coincide com tests/output_T*. O relatório é
+# escrito em JSON e pode ser comparado com um relatório anterior para
+# detetar regressões:
+#
+#   $ python3 benchmark.py -o baseline.json
+#   $ python3 benchmark.py --baseline baseline.json
+#
+# Com --profile, cada execução mede também o tempo de cada método do
+# problema, das regras de dedução e da política de ramificação, e o
+# tamanho da fronteira (ver search.InstrumentedProblem); com --trace, os
+# eventos de cada execução são escritos num ficheiro JSON (formato Chrome
+# trace, para chrome://tracing, Perfetto ou speedscope).
+
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from search import Budget, InstrumentedProblem
+from utils import name, print_table
+from takuzu import (
+    BRANCHING_POLICIES,
+    HEURISTICS,
+    SOLVERS,
+    Board,
+    Takuzu,
+    astar_search,
+    breadth_first_tree_search,
+    depth_first_tree_search,
+    greedy_search,
+    is_solution,
+    raise_timeout,
+    recursive_best_first_search,
+)
+
+SEARCHERS = {
+    name(searcher): searcher
+    for searcher in (
+        depth_first_tree_search,
+        breadth_first_tree_search,
+        greedy_search,
+        astar_search,
+        recursive_best_first_search,
+    )
+}
+
+# Procuras que usam a heurística do problema (Takuzu.h).
+INFORMED_SEARCHERS = {
+    name(searcher)
+    for searcher in (greedy_search, astar_search, recursive_best_first_search)
+}
+
+
+def instances(directory: str):
+    """Devolve a lista ordenada de pares (nome, ficheiro de entrada,
+    ficheiro de saída esperada ou None) da diretoria dada."""
+    pairs = []
+    for path in sorted(glob.glob(os.path.join(directory, "input_*"))):
+        instance = os.path.basename(path)[len("input_") :]
+        expected = os.path.join(directory, "output_" + instance)
+        pairs.append((instance, path, expected if os.path.exists(expected) else None))
+    return pairs
+
+
+def check_solution(board: Board, solution: Board, expected_path) -> bool:
+    """Devolve True se a solução estiver correta: igual à saída esperada,
+    se existir, ou caso contrário completa, válida e com os números
+    dados preenchidos."""
+    if expected_path is not None:
+        with open(expected_path) as expected:
+            return str(solution) == expected.read().strip()
+    return is_solution(board, solution)
+
+
+def run_one(
+    searcher_name: str,
+    policy: str,
+    heuristic: str,
+    instance: str,
+    path: str,
+    expected_path,
+    timeout,
+    profile=False,
+    trace_dir=None,
+):
+    """Corre uma procura, com a política de ramificação e a heurística
+    dadas, sobre uma instância e devolve o registo das
+    medições. É executada num processo próprio, para que a memória
+    máxima (ru_maxrss) seja apenas a desta execução. Com profile, o
+    registo inclui o perfil da execução, e com trace_dir os eventos são
+    escritos nessa diretoria. O tempo limite é verificado pela procura a
+    cada nó expandido (ver search.Budget). Os métodos de SOLVERS (em que
+    searcher_name é o nome do método) são medidos por run_solver."""
+    if searcher_name in SOLVERS:
+        return run_solver(searcher_name, policy, instance, path, expected_path, timeout)
+    board = next(Board.parse_file(path))
+    record = {
+        "instance": instance,
+        "searcher": searcher_name,
+        "policy": policy,
+        "heuristic": heuristic,
+        "size": len(board),
+    }
+    start = time.perf_counter()
+    if heuristic is None:
+        takuzu = Takuzu(board, policy)
+    else:
+        takuzu = Takuzu(board, policy, heuristic)
+    problem = InstrumentedProblem(takuzu, profile, trace=trace_dir is not None)
+    result = SEARCHERS[searcher_name](problem, budget=Budget(seconds=timeout or None))
+    if result.status == "solved":
+        solution = result.node.state.board
+        status = "ok" if check_solution(board, solution, expected_path) else "wrong"
+    elif result.status == "failed":
+        status = "unsolved"
+    else:
+        status = result.status
+    record.update(
+        status=status,
+        seconds=time.perf_counter() - start,
+        nodes_expanded=problem.succs,
+        goal_tests=problem.goal_tests,
+        states=problem.states,
+        peak_memory_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+    if problem.profile:
+        sizes = [size for _, size in problem.frontier]
+        record.update(profile=problem.summary(), max_frontier=max(sizes, default=0))
+    if trace_dir is not None:
+        label = "_".join(
+            str(part) for part in (instance, searcher_name, policy, heuristic)
+        )
+        problem.write_trace(os.path.join(trace_dir, label + ".json"))
+    return record
+
+
+def run_solver(
+    solver: str, policy: str, instance: str, path: str, expected_path, timeout
+):
+    """Corre um dos métodos de SOLVERS sobre uma instância e devolve o
+    registo das medições, como run_one. Estes métodos não verificam um
+    orçamento de procura, pelo que o tempo limite é aplicado com um
+    alarme do sistema; os nós são os contados pelo método."""
+    board = next(Board.parse_file(path))
+    record = {
+        "instance": instance,
+        "searcher": solver,
+        "policy": policy,
+        "heuristic": None,
+        "size": len(board),
+    }
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    try:
+        solution, nodes = SOLVERS[solver](board, policy)
+        if solution is None:
+            status = "unsolved"
+        elif check_solution(board, solution, expected_path):
+            status = "ok"
+        else:
+            status = "wrong"
+    except TimeoutError:
+        status, nodes = "timeout", None
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    record.update(
+        status=status,
+        seconds=time.perf_counter() - start,
+        nodes_expanded=nodes,
+        goal_tests=None,
+        states=None,
+        peak_memory_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+    return record
+
+
+def run_benchmark(
+    directory="tests",
+    searchers=None,
+    policies=None,
+    workers=1,
+    timeout=None,
+    heuristics=None,
+    profile=False,
+    trace_dir=None,
+    solvers=None,
+):
+    """Corre as procuras, políticas de ramificação e heurísticas dadas
+    (por omissão, todas as de SEARCHERS e a política e a heurística por
+    omissão de Takuzu) e os métodos de SOLVERS dados sobre as instâncias
+    da diretoria e devolve o relatório. Se só forem dados métodos, não
+    são corridas procuras. As heurísticas só se aplicam às procuras
+    informadas. Ver run_one para profile e trace_dir."""
+    searchers = (searchers or ([] if solvers else list(SEARCHERS))) + (solvers or [])
+    policies = policies or ["completions"]
+    heuristics = heuristics or ["empties"]
+    runs = [
+        (
+            searcher,
+            policy,
+            heuristic,
+            instance,
+            path,
+            expected,
+            timeout,
+            profile,
+            trace_dir,
+        )
+        for instance, path, expected in instances(directory)
+        for searcher in searchers
+        for policy in policies
+        for heuristic in (heuristics if searcher in INFORMED_SEARCHERS else [None])
+    ]
+    # Um processo novo por execução, para medir a memória de cada uma.
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as executor:
+        futures = [executor.submit(run_one, *run) for run in runs]
+        results = [future.result() for future in futures]
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "timeout": timeout,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance=0.25, min_seconds=0.05):
+    """Devolve a lista de regressões do relatório em relação ao relatório
+    de referência: soluções que deixaram de estar corretas, mais nós
+    expandidos, ou tempos acima do de referência em mais do que a
+    tolerância relativa (e do que min_seconds, para ignorar ruído)."""
+
+    def run_key(record):
+        # Os relatórios anteriores às heurísticas usavam sempre empties.
+        informed = record["searcher"] in INFORMED_SEARCHERS
+        return (
+            record["instance"],
+            record["searcher"],
+            record.get("policy"),
+            record.get("heuristic", "empties" if informed else None),
+        )
+
+    previous = {run_key(record): record for record in baseline["results"]}
+    regressions = []
+    for record in report["results"]:
+        key = run_key(record)
+        if key not in previous:
+            continue
+        old = previous[key]
+        if old["status"] == "ok" and record["status"] != "ok":
+            regressions.append((*key, "status", old["status"], record["status"]))
+            continue
+        if (old["nodes_expanded"] or 0) < (record["nodes_expanded"] or 0):
+            regressions.append(
+                (
+                    *key,
+                    "nodes_expanded",
+                    old["nodes_expanded"],
+                    record["nodes_expanded"],
+                )
+            )
+        if record["seconds"] > old["seconds"] * (1 + tolerance) + min_seconds:
+            regressions.append(
+                (*key, "seconds", round(old["seconds"], 3), round(record["seconds"], 3))
+            )
+    return regressions
+
+
+def print_report(report: dict):
+    """Escreve a tabela de resultados do relatório."""
+    header = [
+        "Instance",
+        "Searcher",
+        "Policy",
+        "Heuristic",
+        "Status",
+        "Seconds",
+        "Nodes",
+        "Goal tests",
+        "Peak KB",
+    ]
+    table = [
+        [
+            r["instance"],
+            r["searcher"],
+            r["policy"],
+            r.get("heuristic") or "-",
+            r["status"],
+            round(r["seconds"], 4),
+            r["nodes_expanded"] if r["nodes_expanded"] is not None else "-",
+            r["goal_tests"] if r["goal_tests"] is not None else "-",
+            r["peak_memory_kb"],
+        ]
+        for r in report["results"]
+    ]
+    print_table(table, header)
+
+    for r in report["results"]:
+        if "profile" in r:
+            print()
+            print(
+                f"{r['instance']} {r['searcher']} {r['policy']} "
+                f"{r.get('heuristic') or '-'}: fronteira máxima {r['max_frontier']}"
+            )
+            print_table(
+                r["profile"], ["Method", "Calls", "Total ms", "Mean us", "Items"]
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mede o desempenho das procuras de takuzu.py."
+    )
+    parser.add_argument(
+        "--tests", default="tests", help="diretoria com input_* e output_*"
+    )
+    parser.add_argument(
+        "--searchers",
+        nargs="+",
+        choices=list(SEARCHERS),
+        help="procuras a medir (por omissão, todas)",
+    )
+    parser.add_argument(
+        "--solvers",
+        nargs="+",
+        choices=list(SOLVERS),
+        help="métodos de takuzu.py a medir (ver takuzu.SOLVERS); sem --searchers, "
+        "só estes são medidos",
+    )
+    parser.add_argument(
+        "--policies",
+        nargs="+",
+        choices=list(BRANCHING_POLICIES),
+        help="políticas de ramificação a medir (por omissão, completions)",
+    )
+    parser.add_argument(
+        "--heuristics",
+        nargs="+",
+        choices=list(HEURISTICS),
+        help="heurísticas das procuras informadas a medir (por omissão, empties)",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="tempo limite por execução"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="mede o tempo de cada método, regra e política e a fronteira",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="DIR",
+        help="escreve nesta diretoria o trace JSON de cada execução",
+    )
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("-o", "--output", help="ficheiro JSON do relatório")
+    parser.add_argument("--baseline", help="relatório JSON de referência")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="aumento relativo de tempo tolerado em relação à referência",
+    )
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.tests,
+        args.searchers,
+        args.policies,
+        args.workers,
+        args.timeout,
+        args.heuristics,
+        args.profile,
+        args.trace,
+        args.solvers,
+    )
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(report, json.load(baseline), args.tolerance)
+        if regressions:
+            print()
+            print_table(
+                regressions,
+                [
+                    "Instance",
+                    "Searcher",
+                    "Policy",
+                    "Heuristic",
+                    "Metric",
+                    "Baseline",
+                    "Now",
+                ],
+            )
+            sys.exit(1)
@@ -0,0 +1,107 @@
+# cache.py: Cache persistente de resultados, em SQLite.
+#
+# Guarda pares (chave, valor) de texto num ficheiro SQLite, com um número
+# máximo de entradas: quando é excedido, são removidas as entradas usadas
+# há mais tempo (LRU). O ficheiro pode ser partilhado por vários
+# processos.
+#
+# Para não contar as entradas a cada inserção, cada ResultCache mantém
+# uma contagem própria, atualizada com as suas inserções, e só conta as
+# entradas do ficheiro quando essa contagem excede o máximo ou passadas
+# EVICT_FRACTION * máximo inserções desde a última contagem. A remoção
+# leva a cache abaixo do máximo pela mesma margem, para que a contagem
+# seguinte só se repita passadas várias inserções.
+#
+# Com vários processos, cada um só vê as inserções dos outros quando
+# conta as entradas do ficheiro: o máximo é aproximado e pode ser
+# excedido em até cerca de EVICT_FRACTION * máximo entradas por processo.
+
+import sqlite3
+import time
+
+CACHE_SIZE = 100_000
+
+# Fração do número máximo de entradas removida, além do excesso, em cada
+# remoção LRU, e que é o número de inserções entre contagens.
+EVICT_FRACTION = 0.1
+
+
+class ResultCache:
+    """Cache persistente (chave -> valor) com remoção LRU."""
+
+    def __init__(self, path: str, max_entries=CACHE_SIZE):
+        """Abre (ou cria) a cache no ficheiro dado."""
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used INTEGER NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+        )
+        self.connection.commit()
+        # Estimativa do número de entradas e inserções desde a última
+        # contagem (ver put).
+        self.entries = len(self)
+        self.inserts = 0
+        self.margin = int(max_entries * EVICT_FRACTION)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """Devolve o número de entradas da cache."""
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, key: str):
+        """Devolve o valor guardado com a chave dada, ou None, e marca a
+        entrada como usada agora."""
+        row = self.connection.execute(
+            "SELECT value FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE results SET used = ? WHERE key = ?", (time.time_ns(), key)
+            )
+        return row[0]
+
+    def put(self, key: str, value: str):
+        """Guarda o valor com a chave dada e, se a cache exceder o número
+        máximo de entradas, remove as usadas há mais tempo."""
+        with self.connection:
+            updated = self.connection.execute(
+                "UPDATE results SET value = ?, used = ? WHERE key = ?",
+                (value, time.time_ns(), key),
+            ).rowcount
+            if updated:
+                return
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, value, used) VALUES (?, ?, ?)",
+                (key, value, time.time_ns()),
+            )
+            self.entries += 1
+            self.inserts += 1
+            if self.entries <= self.max_entries and self.inserts < self.margin:
+                return
+            # Outros processos podem ter inserido ou removido entradas:
+            # a contagem é refeita antes de remover.
+            self.entries = len(self)
+            self.inserts = 0
+            excess = self.entries - self.max_entries
+            if excess > 0:
+                excess += self.margin
+                self.entries -= self.connection.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY used LIMIT ?)",
+                    (excess,),
+                ).rowcount
@@ -0,0 +1,230 @@
+# generator.py: Geração de instâncias de Takuzu com solução única.
+#
+# Cada instância é gerada a partir de uma grelha completa aleatória,
+# construída linha a linha: cada linha é escolhida uniformemente entre as
+# linhas válidas compatíveis com os prefixos das colunas (ver
+# patterns.sample_line). Depois, as posições são retiradas por ordem
+# aleatória enquanto a solução continuar a ser única (ver
+# takuzu.count_solutions); como retirar mais posições nunca torna a
+# solução única, sem limite de nós na verificação (--max-nodes 0) o
+# resultado é mínimo: nenhuma das posições que ficam pode ser retirada.
+# A dificuldade é o conjunto de regras de dedução necessário para
+# resolver a instância sem procura.
+#
+#   $ python3 generator.py -n 10 20 --count 8 -j 4
+#   $ python3 generator.py -n 12 --count 5 --output-dir tests --prefix G
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from patterns import sample_line
+from takuzu import RULES, Board, count_solutions
+
+# Níveis de dificuldade, por ordem: o nível de uma instância é o primeiro
+# cujas regras a resolvem só por propagação, ou "search" se nenhum a
+# resolver.
+DIFFICULTY_RULES = {
+    "adjacency": ("adjacency",),
+    "count": ("adjacency", "count"),
+    "uniqueness": ("adjacency", "count", "uniqueness"),
+    "only_option": tuple(RULES),
+}
+
+# Nós de procura com que a unicidade tem de ser provada para se retirar
+# uma posição: as instâncias mínimas podem exigir procuras muito longas
+# para provar a unicidade, e o limite mantém o tempo de geração
+# previsível (à custa de deixar algumas posições a mais).
+UNIQUENESS_NODES = 200
+
+# Nós de procura com que é medida a dificuldade das instâncias que a
+# propagação não resolve: a unicidade já foi garantida por reduce_clues,
+# pelo que basta encontrar a solução, e o limite evita procuras longas nas
+# instâncias grandes.
+DIFFICULTY_NODES = 10_000
+
+# Linhas sorteadas sem sucesso numa mesma linha antes de recuar para a
+# linha anterior.
+ROW_ATTEMPTS = 4
+
+
+def random_grid(n: int, rng) -> Board:
+    """Devolve uma grelha completa e válida de dimensão n, aleatória.
+
+    As linhas são escolhidas de cima para baixo. Cada linha é sorteada
+    entre as linhas válidas compatíveis com as posições já fixadas e
+    jogada no tabuleiro, cuja propagação verifica os prefixos das colunas
+    (e as linhas e colunas repetidas) e fixa posições das linhas
+    seguintes. Se a linha levar a uma contradição é desfeita e sorteada
+    outra; ao fim de ROW_ATTEMPTS tentativas falhadas recua-se também a
+    linha anterior, e ao fim de ROW_ATTEMPTS * n a grelha é recomeçada."""
+    while True:
+        board = Board(((2,) * n,) * n)
+        trail = []
+        # Comprimento do trilho antes de cada linha escolhida.
+        lengths = []
+        attempts = [0] * n
+        failures = 0
+        while len(lengths) < n and failures < ROW_ATTEMPTS * n:
+            i = len(lengths)
+            length = len(trail)
+            row = sample_line(n, board.row_filled[i], board.row_ones[i], rng)
+            if row is not None and place_row(board, i, row, trail):
+                lengths.append(length)
+                continue
+            board.undo(trail, length)
+            failures += 1
+            attempts[i] += 1
+            if attempts[i] >= ROW_ATTEMPTS and lengths:
+                attempts[i] = 0
+                board.undo(trail, lengths.pop())
+        if len(lengths) == n:
+            return board
+
+
+def place_row(board: Board, i: int, row: int, trail: list) -> bool:
+    """Joga as posições vazias da linha i com os valores da máscara de
+    uns row. Devolve False se encontrar uma contradição."""
+    for j in range(len(board)):
+        if board.get_number(i, j) == 2:
+            if not board.play(i, j, row >> j & 1, trail=trail):
+                return False
+    return True
+
+
+def reduce_clues(solution: Board, rng, max_nodes=UNIQUENESS_NODES) -> Board:
+    """Retira posições da grelha completa, por ordem aleatória, enquanto a
+    solução continuar a ser única. Devolve a instância resultante.
+
+    Como a instância atual só tem a solução dada, retirar uma posição
+    mantém a solução única se e só se a instância com o valor oposto
+    nessa posição não tiver solução. Isso é verificado com
+    count_solutions (limite 1, que pára na primeira solução) e a posição
+    só é retirada se a prova couber em max_nodes nós de procura."""
+    n = len(solution)
+    grid = [list(row) for row in solution.board]
+    cells = [(i, j) for i in range(n) for j in range(n)]
+    rng.shuffle(cells)
+    for i, j in cells:
+        number = grid[i][j]
+        grid[i][j] = 1 - number
+        opposite = Board(tuple(map(tuple, grid)))
+        unique = count_solutions(opposite, 1, max_nodes=max_nodes)[0] == 0
+        grid[i][j] = 2 if unique else number
+    return Board(tuple(map(tuple, grid)))
+
+
+def difficulty(board: Board, max_nodes=DIFFICULTY_NODES) -> (str, int):
+    """Devolve o nível de dificuldade da instância (ver DIFFICULTY_RULES)
+    e os nós expandidos pela procura da solução, que são 0 se bastar a
+    propagação. A procura pára ao fim de max_nodes nós (o nível continua
+    a ser "search")."""
+    for level, rules in DIFFICULTY_RULES.items():
+        propagated = board.copy()
+        if propagated.propagate(rules) and not propagated.empties:
+            return level, 0
+    _, nodes = count_solutions(board, 1, max_nodes=max_nodes)
+    return "search", nodes
+
+
+def generate(n: int, seed: int, max_nodes=UNIQUENESS_NODES) -> dict:
+    """Gera uma instância de dimensão n com a semente dada (ver
+    reduce_clues para max_nodes). Devolve um dicionário com a instância, a
+    solução e as suas características."""
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    solution = random_grid(n, rng)
+    puzzle = reduce_clues(solution, rng, max_nodes)
+    level, nodes = difficulty(puzzle)
+    return {
+        "seed": seed,
+        "size": n,
+        "clues": n * n - puzzle.empties,
+        "difficulty": level,
+        "nodes": nodes,
+        "seconds": time.perf_counter() - start,
+        "puzzle": puzzle,
+        "solution": solution,
+    }
+
+
+def generate_many(sizes, count: int, seed=0, workers=None, max_nodes=UNIQUENESS_NODES):
+    """Gera count instâncias num conjunto de processos, percorrendo as
+    dimensões dadas em ciclo, e devolve-as (ver generate) à medida que
+    ficam prontas. A k-ésima instância usa a semente seed + k, pelo que o
+    resultado não depende do número de processos. Só há alguns pedidos
+    pendentes de cada vez, para que as instâncias possam ser escritas à
+    medida que são geradas."""
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        tasks = deque((sizes[k % len(sizes)], seed + k) for k in range(count))
+        while tasks or pending:
+            while tasks and len(pending) < 2 * workers:
+                n, task_seed = tasks.popleft()
+                pending.add(executor.submit(generate, n, task_seed, max_nodes))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def instance_text(board: Board) -> str:
+    """Devolve o tabuleiro no formato de entrada (N e as N linhas)."""
+    return f"{len(board)}\n{board}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Gera instâncias de Takuzu com solução única."
+    )
+    parser.add_argument(
+        "-n", "--sizes", type=int, nargs="+", default=[10], help="dimensões N"
+    )
+    parser.add_argument("--count", type=int, default=1, help="número de instâncias")
+    parser.add_argument("--seed", type=int, default=0, help="semente inicial")
+    parser.add_argument(
+        "-j", "--workers", type=int, help="número de processos (por omissão, CPUs)"
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="escreve cada instância em input_<prefixo><k> e a solução em "
+        "output_<prefixo><k> nesta diretoria, em vez de no standard output",
+    )
+    parser.add_argument("--prefix", default="G", help="prefixo dos ficheiros")
+    parser.add_argument(
+        "--max-nodes",
+        type=int,
+        default=UNIQUENESS_NODES,
+        help="nós de procura para provar a unicidade ao retirar cada posição "
+        "(0 para não limitar e obter instâncias mínimas)",
+    )
+    args = parser.parse_args()
+    if min(args.sizes) < 4:
+        parser.error("as dimensões têm de ser pelo menos 4")
+
+    results = generate_many(
+        args.sizes, args.count, args.seed, args.workers, args.max_nodes or None
+    )
+    for result in results:
+        summary = (
+            f"# seed={result['seed']} size={result['size']} "
+            f"clues={result['clues']} difficulty={result['difficulty']} "
+            f"nodes={result['nodes']} seconds={result['seconds']:.3f}"
+        )
+        if args.output_dir:
+            # Os ficheiros são numerados pela ordem das sementes, e não
+            # pela ordem de conclusão.
+            name = f"{args.prefix}{result['seed'] - args.seed + 1:02d}"
+            with open(os.path.join(args.output_dir, f"input_{name}"), "w") as output:
+                output.write(instance_text(result["puzzle"]) + "\n")
+            with open(os.path.join(args.output_dir, f"output_{name}"), "w") as output:
+                output.write(f"{result['solution']}\n")
+            print(f"{name} {summary[2:]}", file=sys.stderr)
+        else:
+            print(summary)
+            print(instance_text(result["puzzle"]))
+        sys.stdout.flush()
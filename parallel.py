@@ -0,0 +1,291 @@
+# parallel.py: Procura em profundidade paralela, com roubo de trabalho.
+#
+# Um tabuleiro grande é resolvido por vários processos sobre o problema
+# Takuzu. Cada processo faz uma procura em profundidade sobre a sua
+# subárvore, com as ramificações de Takuzu.actions, numa pilha local.
+# Quando há processos sem trabalho, os processos ocupados cedem a
+# subárvore aberta mais próxima da raiz (a do fundo da pilha, em
+# princípio a maior) para uma fila partilhada, de onde os processos
+# livres a roubam. As subárvores são enviadas como tabuleiros compactos
+# (ver Board.to_bytes), e não como cadeias de nós serializadas. A
+# primeira solução encontrada pára todos os processos.
+#
+#   $ python3 parallel.py -j 4 < tests/input_T13
+#
+# Com --speedup, mede o tempo de cada instância com cada número de
+# processos e escreve as curvas de aceleração (speedup) em relação a um
+# processo, por exemplo sobre instâncias geradas de 30x30 a 40x40:
+#
+#   $ python3 generator.py -n 30 35 40 --count 6 --output-dir big --prefix P
+#   $ python3 parallel.py --speedup big -j 1 2 4 8 16 -o speedup.json
+#
+# O repositório só inclui a ferramenta: as curvas têm de ser medidas numa
+# máquina com vários CPUs.
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+
+from utils import print_table
+from takuzu import (
+    BRANCHING_POLICIES,
+    Board,
+    Takuzu,
+    TakuzuState,
+    is_solution,
+    labelled_instances,
+)
+
+# Intervalo, em segundos, com que os processos sem trabalho verificam se
+# a procura já terminou.
+POLL_SECONDS = 0.01
+
+
+class SharedCounters:
+    """Contadores partilhados pelos processos, protegidos por um único
+    trinco: subárvores por explorar (na fila ou em exploração), subárvores
+    na fila e processos à espera de trabalho."""
+
+    def __init__(self):
+        self.lock = multiprocessing.Lock()
+        self.outstanding = multiprocessing.Value("i", 0, lock=False)
+        self.queued = multiprocessing.Value("i", 0, lock=False)
+        self.waiting = multiprocessing.Value("i", 0, lock=False)
+
+    def hungry(self) -> bool:
+        """Devolve True se houver mais processos à espera do que
+        subárvores na fila. A leitura não usa o trinco: um valor
+        desatualizado só atrasa ou antecipa uma cedência."""
+        return self.waiting.value > self.queued.value
+
+
+def share(tasks, counters: SharedCounters, board: Board):
+    """Põe o tabuleiro na fila partilhada, como uma subárvore por
+    explorar."""
+    with counters.lock:
+        counters.outstanding.value += 1
+        counters.queued.value += 1
+    tasks.put(board.to_bytes())
+
+
+def worker(root: bytes, policy: str, tasks, results, counters, done):
+    """Corpo de cada processo: retira subárvores da fila e explora-as em
+    profundidade até a procura terminar. Envia para a fila de resultados
+    ("solution", tabuleiro compacto) se encontrar uma solução e, no fim,
+    ("stats", nós expandidos, subárvores roubadas, subárvores cedidas).
+    O tabuleiro root já tem as deduções aplicadas, pelo que o problema é
+    criado sem as repetir."""
+    problem = Takuzu(Board.from_bytes(root), policy, propagate=False)
+    steals = donations = 0
+    while not done.is_set():
+        with counters.lock:
+            counters.waiting.value += 1
+        data = None
+        while data is None and not done.is_set():
+            try:
+                data = tasks.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                pass
+        with counters.lock:
+            counters.waiting.value -= 1
+            if data is not None:
+                counters.queued.value -= 1
+        if data is None:
+            break
+        steals += 1
+
+        stack = deque([TakuzuState(Board.from_bytes(data))])
+        while stack and not done.is_set():
+            state = stack.pop()
+            if problem.goal_test(state):
+                results.put(("solution", state.board.to_bytes()))
+                done.set()
+                break
+            stack.extend(
+                problem.result(state, action) for action in problem.actions(state)
+            )
+            if len(stack) > 1 and counters.hungry():
+                # Cede a subárvore aberta mais próxima da raiz; as que já
+                # têm uma contradição são descartadas.
+                while len(stack) > 1 and stack[0].board.contradiction:
+                    stack.popleft()
+                if len(stack) > 1:
+                    share(tasks, counters, stack.popleft().board)
+                    donations += 1
+
+        with counters.lock:
+            counters.outstanding.value -= 1
+            if counters.outstanding.value == 0:
+                # Não há subárvores por explorar: o tabuleiro não tem
+                # solução.
+                done.set()
+
+    results.put(("stats", problem.nodes_expanded, steals, donations))
+
+
+def parallel_solve(board: Board, workers=None, policy="completions"):
+    """Resolve o tabuleiro com uma procura em profundidade em workers
+    processos (por omissão, um por CPU), com roubo de trabalho. Devolve o
+    tuplo (tabuleiro resolvido ou None, nós expandidos, subárvores
+    roubadas), em que a primeira subárvore de cada processo também conta
+    como roubada."""
+    workers = workers or os.cpu_count()
+    initial = Takuzu(board, policy).initial.board
+    if initial.contradiction:
+        return None, 0, 0
+    root = initial.to_bytes()
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    counters = SharedCounters()
+    done = multiprocessing.Event()
+    share(tasks, counters, initial)
+
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(root, policy, tasks, results, counters, done),
+            daemon=True,
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    solution = None
+    nodes = steals = 0
+    finished = 0
+    try:
+        while finished < workers:
+            try:
+                message = results.get(timeout=1)
+            except queue.Empty:
+                if results.empty() and not any(p.is_alive() for p in processes):
+                    raise RuntimeError("os processos terminaram sem enviar resultados")
+                continue
+            if message[0] == "solution":
+                solution = Board.from_bytes(message[1])
+            else:
+                finished += 1
+                nodes += message[1]
+                steals += message[2]
+    finally:
+        done.set()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+    if solution is not None and not is_solution(board, solution):
+        raise RuntimeError("a procura paralela devolveu uma solução inválida")
+    return solution, nodes, steals
+
+
+def speedup_curves(boards, worker_counts, policy="completions", repeat=1):
+    """Resolve cada par (etiqueta, tabuleiro) com cada número de processos
+    (o melhor de repeat medições) e devolve a lista de registos com a
+    etiqueta, a dimensão, os processos, os segundos, os nós expandidos, as
+    subárvores roubadas e a aceleração em relação ao primeiro número de
+    processos dado."""
+    records = []
+    for label, board in boards:
+        reference = None
+        for workers in worker_counts:
+            seconds = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                solution, nodes, steals = parallel_solve(board, workers, policy)
+                elapsed = time.perf_counter() - start
+                seconds = elapsed if seconds is None else min(seconds, elapsed)
+            reference = reference or seconds
+            records.append(
+                {
+                    "instance": label,
+                    "size": len(board),
+                    "workers": workers,
+                    "seconds": seconds,
+                    "nodes": nodes,
+                    "steals": steals,
+                    "solved": solution is not None,
+                    "speedup": reference / seconds,
+                }
+            )
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resolve instâncias de Takuzu com uma procura em "
+        "profundidade paralela."
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        nargs="+",
+        help="número de processos (por omissão, CPUs); com --speedup, a "
+        "lista de números de processos a medir (por omissão, 1 2 4 8 16)",
+    )
+    parser.add_argument(
+        "--policy",
+        choices=list(BRANCHING_POLICIES),
+        default="completions",
+        help="política de escolha da posição onde ramificar",
+    )
+    parser.add_argument(
+        "--speedup",
+        nargs="+",
+        metavar="INPUT",
+        help="mede as curvas de aceleração nestes ficheiros, diretorias ou "
+        "padrões glob",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="medições de cada ponto da curva"
+    )
+    parser.add_argument("-o", "--output", help="ficheiro JSON das curvas")
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="escreve no stderr os nós expandidos e as subárvores roubadas",
+    )
+    args = parser.parse_args()
+
+    if args.speedup:
+        records = speedup_curves(
+            labelled_instances(args.speedup),
+            args.workers or [1, 2, 4, 8, 16],
+            args.policy,
+            args.repeat,
+        )
+        print_table(
+            [
+                [
+                    r["instance"],
+                    r["size"],
+                    r["workers"],
+                    round(r["seconds"], 3),
+                    r["nodes"],
+                    r["steals"],
+                    round(r["speedup"], 2),
+                ]
+                for r in records
+            ],
+            ["Instance", "N", "Workers", "Seconds", "Nodes", "Steals", "Speedup"],
+        )
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump(
+                    {"cpus": os.cpu_count(), "results": records}, output, indent=2
+                )
+        sys.exit()
+
+    board = Board.parse_instance_from_stdin()
+    workers = args.workers[0] if args.workers else None
+    solution, nodes, steals = parallel_solve(board, workers, args.policy)
+    print(solution)
+    if args.stats:
+        print(f"nós expandidos: {nodes} subárvores roubadas: {steals}", file=sys.stderr)
@@ -0,0 +1,280 @@
+# patterns.py: Tabelas das linhas válidas de cada dimensão.
+#
+# Uma linha (ou coluna) completa de dimensão N é válida se não tiver três
+# números iguais seguidos e tiver no máximo ceil(N / 2) zeros e
+# ceil(N / 2) uns. O conjunto dessas linhas depende apenas de N, pelo que
+# é gerado uma vez e guardado em disco, em PATTERNS_DIR/N, com:
+# - patterns.npy: as máscaras de uns (bit j = posição j), ordenadas
+# - prefix_keys.npy e by_prefix.npy: as mesmas linhas ordenadas pelas
+#   primeiras posições (chave com os bits invertidos), para obter por
+#   pesquisa binária o intervalo das linhas com um dado prefixo
+# - cells.npy: para cada posição e valor, o conjunto (bitset) das linhas
+#   de patterns.npy com esse valor nessa posição
+# Os ficheiros são abertos com np.load(mmap_mode="r"): os processos que
+# usam a mesma tabela partilham as páginas do ficheiro, sem a gerar nem
+# copiar.
+#
+# As tabelas são geradas e escritas em disco na primeira vez que são
+# precisas, mesmo numa simples execução de "python takuzu.py < input":
+# line_options consulta a tabela das dimensões até STORE_LOOKUP_SIZE
+# (1,6 MB para N = 24), e rows_solve a de qualquer dimensão até
+# MAX_PATTERN_SIZE (26 MB para N = 30 e 67 MB para N = 32). A diretoria
+# PATTERNS_DIR é ~/.cache/takuzu, ou a dada pela variável de ambiente
+# TAKUZU_PATTERNS.
+
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+
+PATTERNS_DIR = os.environ.get(
+    "TAKUZU_PATTERNS", os.path.join(os.path.expanduser("~"), ".cache", "takuzu")
+)
+
+# Dimensão máxima com tabela: para N = 32 há cerca de 2,2 milhões de
+# linhas válidas (17 MB por ficheiro, 67 MB com os quatro), e o número
+# cresce cerca de 2,5 vezes a cada duas posições. Acima disto as linhas são enumeradas a partir das posições
+# preenchidas (ver line_candidates).
+MAX_PATTERN_SIZE = 32
+
+
+def generate_patterns(n: int) -> np.ndarray:
+    """Gera o array ordenado (uint64) das máscaras de uns de todas as
+    linhas válidas de dimensão n, estendendo todos os prefixos válidos
+    uma posição de cada vez."""
+    limit = (n + 1) // 2
+    masks = np.zeros(1, dtype=np.uint64)
+    n_ones = np.zeros(1, dtype=np.int8)
+    for pos in range(n):
+        if pos >= 2:
+            last = (masks >> np.uint64(pos - 1)) & np.uint64(1)
+            before = (masks >> np.uint64(pos - 2)) & np.uint64(1)
+            run = last == before
+        new_masks = []
+        new_ones = []
+        for value in (0, 1):
+            ones = n_ones + value
+            valid = (ones <= limit) & (pos + 1 - ones <= limit)
+            if pos >= 2:
+                valid &= ~(run & (last == value))
+            new_masks.append(masks[valid] | np.uint64(value << pos))
+            new_ones.append(ones[valid])
+        masks = np.concatenate(new_masks)
+        n_ones = np.concatenate(new_ones)
+    masks.sort()
+    return masks
+
+
+def reverse_bits(masks: np.ndarray, n: int) -> np.ndarray:
+    """Devolve as máscaras com a ordem dos n bits invertida (a posição 0
+    passa a ser o bit mais significativo)."""
+    keys = np.zeros_like(masks)
+    for j in range(n):
+        keys |= ((masks >> np.uint64(j)) & np.uint64(1)) << np.uint64(n - 1 - j)
+    return keys
+
+
+def build_store(n: int) -> dict:
+    """Gera os arrays da tabela de dimensão n (nome -> array)."""
+    patterns = generate_patterns(n)
+    keys = reverse_bits(patterns, n)
+    order = np.argsort(keys)
+    cells = np.empty((n, 2, (len(patterns) + 7) // 8), dtype=np.uint8)
+    for j in range(n):
+        ones = ((patterns >> np.uint64(j)) & np.uint64(1)).astype(bool)
+        cells[j, 0] = np.packbits(~ones)
+        cells[j, 1] = np.packbits(ones)
+    return {
+        "patterns": patterns,
+        "prefix_keys": keys[order],
+        "by_prefix": patterns[order],
+        "cells": cells,
+    }
+
+
+def write_store(arrays: dict, path: str):
+    """Escreve os arrays da tabela na diretoria path. A escrita é atómica:
+    os ficheiros são escritos numa diretoria temporária, depois renomeada,
+    pelo que outro processo nunca lê uma tabela incompleta. Se outro
+    processo a criar primeiro, a cópia temporária é descartada."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(temporary)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f"{name}.npy"), array)
+        os.rename(temporary, path)
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+class PatternStore:
+    """Tabela persistente das linhas válidas de dimensão n (ver o início
+    do ficheiro)."""
+
+    def __init__(self, n: int, directory=None):
+        """Abre a tabela de dimensão n em directory (por omissão
+        PATTERNS_DIR), gerando-a se ainda não existir. Se não for possível
+        escrever na diretoria, a tabela fica apenas em memória."""
+        if n > MAX_PATTERN_SIZE:
+            raise ValueError(f"sem tabela de linhas para N = {n} > {MAX_PATTERN_SIZE}")
+        self.n = n
+        path = os.path.join(directory or PATTERNS_DIR, str(n))
+        arrays = None
+        if not os.path.isdir(path):
+            arrays = build_store(n)
+            try:
+                write_store(arrays, path)
+            except OSError:
+                pass
+        if os.path.isdir(path):
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in ("patterns", "prefix_keys", "by_prefix", "cells")
+            }
+        self.patterns = arrays["patterns"]
+        self.prefix_keys = arrays["prefix_keys"]
+        self.by_prefix = arrays["by_prefix"]
+        self.cells = arrays["cells"]
+
+    def __len__(self):
+        """Devolve o número de linhas válidas."""
+        return len(self.patterns)
+
+    def prefix_range(self, k: int, prefix: int) -> (int, int):
+        """Devolve o intervalo [lo, hi) de by_prefix com as linhas cujas k
+        primeiras posições têm os valores da máscara prefix."""
+        shift = self.n - k
+        key = int(reverse_bits(np.array([prefix], dtype=np.uint64), k)[0])
+        lo, hi = np.searchsorted(
+            self.prefix_keys,
+            np.array([key << shift, (key + 1) << shift], dtype=np.uint64),
+        )
+        return int(lo), int(hi)
+
+    def matching(self, filled: int, ones: int) -> np.ndarray:
+        """Devolve o array das máscaras de uns das linhas válidas
+        compatíveis com as posições preenchidas da linha dada pelas
+        máscaras (preenchidas, uns).
+
+        Se a linha começar por k posições preenchidas, as linhas com esse
+        prefixo formam um intervalo de by_prefix, que é filtrado por
+        máscara. Se o intervalo for grande (prefixo curto ou vazio), é
+        mais barato intersetar os bitsets de cells das posições
+        preenchidas."""
+        prefix = (~filled & (filled + 1)).bit_length() - 1
+        lo, hi = self.prefix_range(prefix, ones & ((1 << prefix) - 1))
+        # Custo de cada caminho em bytes lidos: 8 por linha do intervalo ou
+        # um bitset por posição preenchida.
+        if not filled or 8 * (hi - lo) <= filled.bit_count() * self.cells.shape[2]:
+            candidates = self.by_prefix[lo:hi]
+            return candidates[
+                (candidates & np.uint64(filled)) == np.uint64(ones)
+            ].copy()
+
+        selected = None
+        while filled:
+            j = (filled & -filled).bit_length() - 1
+            bitset = self.cells[j, ones >> j & 1]
+            selected = bitset.copy() if selected is None else selected & bitset
+            filled &= filled - 1
+        return self.patterns[np.flatnonzero(np.unpackbits(selected))]
+
+    def options(self, filled: int, ones: int) -> (int, int, int):
+        """Devolve o mesmo que line_options de takuzu.py (completações,
+        posições forçadas, forçadas a 1), por consulta da tabela."""
+        matches = self.matching(filled, ones)
+        if not len(matches):
+            return 0, 0, 0
+        always = int(np.bitwise_and.reduce(matches))
+        sometimes = int(np.bitwise_or.reduce(matches))
+        empty = ((1 << self.n) - 1) & ~filled
+        forced = (always | ~sometimes) & empty
+        return len(matches), forced, always & forced
+
+
+@lru_cache(maxsize=None)
+def pattern_store(n: int) -> PatternStore:
+    """Devolve a tabela de dimensão n, aberta uma vez por processo."""
+    return PatternStore(n)
+
+
+def enumerate_lines(n: int, filled: int, ones: int):
+    """Gera as máscaras de uns das linhas válidas de dimensão n que
+    completam a linha dada pelas máscaras (preenchidas, uns)."""
+    limit = (n + 1) // 2
+
+    def extend(pos, mask, zeros, n_ones, last, run):
+        if pos == n:
+            yield mask
+            return
+        values = ((ones >> pos) & 1,) if filled >> pos & 1 else (0, 1)
+        for value in values:
+            new_run = run + 1 if value == last else 1
+            if new_run > 2 or zeros + 1 - value > limit or n_ones + value > limit:
+                continue
+            yield from extend(
+                pos + 1,
+                mask | value << pos,
+                zeros + 1 - value,
+                n_ones + value,
+                value,
+                new_run,
+            )
+
+    return extend(0, 0, 0, 0, 2, 0)
+
+
+def line_candidates(n: int, filled: int, ones: int) -> np.ndarray:
+    """Devolve o array (uint64) das máscaras de uns das linhas válidas de
+    dimensão n compatíveis com as posições preenchidas da linha dada
+    pelas máscaras (preenchidas, uns)."""
+    if n <= MAX_PATTERN_SIZE:
+        return pattern_store(n).matching(filled, ones)
+    if n > 64:
+        raise ValueError(f"linhas de dimensão {n} não cabem em 64 bits")
+    return np.fromiter(enumerate_lines(n, filled, ones), dtype=np.uint64)
+
+
+def sample_line(n: int, filled: int, ones: int, rng):
+    """Devolve a máscara de uns de uma linha válida de dimensão n que
+    completa a linha dada pelas máscaras (preenchidas, uns), escolhida
+    uniformemente entre todas as que existem (com o gerador aleatório
+    rng), ou None se não existir nenhuma.
+
+    As completações a partir de cada estado (posição, zeros, uns, último
+    valor, repetições) são contadas uma vez, e a linha é construída
+    posição a posição, escolhendo cada valor com probabilidade
+    proporcional ao número de completações que deixa."""
+    limit = (n + 1) // 2
+    memo = {}
+
+    def successors(pos, zeros, n_ones, last, run):
+        values = ((ones >> pos) & 1,) if filled >> pos & 1 else (0, 1)
+        for value in values:
+            new_run = run + 1 if value == last else 1
+            if new_run > 2 or zeros + 1 - value > limit or n_ones + value > limit:
+                continue
+            yield value, (pos + 1, zeros + 1 - value, n_ones + value, value, new_run)
+
+    def count(state):
+        if state[0] == n:
+            return 1
+        if state not in memo:
+            memo[state] = sum(count(nxt) for _, nxt in successors(*state))
+        return memo[state]
+
+    state = (0, 0, 0, 2, 0)
+    if not count(state):
+        return None
+    mask = 0
+    while state[0] < n:
+        options = [(value, nxt, count(nxt)) for value, nxt in successors(*state)]
+        choice = rng.randrange(sum(weight for _, _, weight in options))
+        for value, nxt, weight in options:
+            if choice < weight:
+                break
+            choice -= weight
+        mask |= value << state[0]
+        state = nxt
+    return mask
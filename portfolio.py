@@ -0,0 +1,259 @@
+# portfolio.py: Resolução de Takuzu com um portefólio de estratégias.
+#
+# Métodos diferentes ganham em tabuleiros diferentes, e não se sabe à
+# partida qual usar: o portefólio corre várias estratégias (um método de
+# SOLVERS ou uma procura de search.py, com uma política de ramificação e,
+# nas procuras informadas, uma heurística) em processos separados sobre o
+# mesmo tabuleiro. A primeira solução que for verificada ganha e os
+# restantes processos são terminados de imediato. Cada resolução pode ser
+# registada num ficheiro JSON Lines, para afinar a composição do
+# portefólio com --stats.
+#
+#   $ python3 portfolio.py tests --log portfolio.jsonl
+#   $ python3 portfolio.py tests --strategies trail:first cbj:wdeg greedy_search
+#   $ python3 portfolio.py --stats portfolio.jsonl
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from collections import defaultdict
+from multiprocessing.connection import wait
+
+from utils import name, print_table
+from takuzu import (
+    BRANCHING_POLICIES,
+    HEURISTICS,
+    SOLVERS,
+    Board,
+    Takuzu,
+    astar_search,
+    depth_first_tree_search,
+    greedy_search,
+    is_solution,
+    labelled_instances,
+    recursive_best_first_search,
+)
+
+# Procuras de search.py que podem fazer parte do portefólio, além dos
+# métodos de SOLVERS.
+SEARCHERS = {
+    name(searcher): searcher
+    for searcher in (
+        depth_first_tree_search,
+        greedy_search,
+        astar_search,
+        recursive_best_first_search,
+    )
+}
+
+# Estratégias por omissão, no formato "método:política[:heurística]".
+DEFAULT_PORTFOLIO = (
+    "trail:completions",
+    "cbj:wdeg",
+    "sat:completions",
+    "astar_search:completions:empties",
+)
+
+
+def parse_strategy(text: str) -> tuple:
+    """Devolve o triplo (método, política, heurística) da estratégia
+    "método:política[:heurística]". A heurística só se aplica às procuras
+    informadas de search.py e é None se não for dada. Por omissão, a
+    política é completions."""
+    method, _, rest = text.partition(":")
+    policy, _, heuristic = rest.partition(":")
+    policy, heuristic = policy or "completions", heuristic or None
+    if method not in SOLVERS and method not in SEARCHERS:
+        raise ValueError(f"método desconhecido: {method}")
+    if policy not in BRANCHING_POLICIES:
+        raise ValueError(f"política desconhecida: {policy}")
+    if heuristic is not None and heuristic not in HEURISTICS:
+        raise ValueError(f"heurística desconhecida: {heuristic}")
+    return method, policy, heuristic
+
+
+def run_strategy(board: Board, strategy: str):
+    """Resolve o tabuleiro com a estratégia dada. Devolve o par
+    (tabuleiro resolvido ou None, nós expandidos)."""
+    method, policy, heuristic = parse_strategy(strategy)
+    if method in SOLVERS:
+        return SOLVERS[method](board, policy)
+    problem = Takuzu(board, policy, heuristic or "empties")
+    goal_node = SEARCHERS[method](problem)
+    return goal_node.state.board if goal_node else None, problem.nodes_expanded
+
+
+def strategy_worker(board: Board, strategy: str, connection):
+    """Corpo de cada processo do portefólio: envia pela ligação o tuplo
+    (estado, solução, nós expandidos, segundos), em que o estado é "ok",
+    "unsolvable" ou "error"."""
+    start = time.perf_counter()
+    try:
+        solution, nodes = run_strategy(board, strategy)
+        status = "ok" if solution is not None else "unsolvable"
+    except Exception as error:
+        solution, nodes, status = repr(error), None, "error"
+    connection.send((status, solution, nodes, time.perf_counter() - start))
+    connection.close()
+
+
+def portfolio_solve(board: Board, strategies=DEFAULT_PORTFOLIO, timeout=None):
+    """Resolve o tabuleiro correndo as estratégias dadas, cada uma no seu
+    processo. A primeira solução verificada (ver is_solution) ganha e os
+    outros processos são terminados. Um tabuleiro só é dado como sem
+    solução quando todas as estratégias terminam sem a encontrar.
+
+    Devolve o par (tabuleiro resolvido ou None, registo), em que o registo
+    tem o estado ("ok", "unsolvable", "error" ou "timeout"), a estratégia
+    vencedora, os segundos e os resultados das estratégias que terminaram
+    (estado, nós expandidos e segundos de cada uma)."""
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    processes = {}
+    for strategy in strategies:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=strategy_worker, args=(board, strategy, sender), daemon=True
+        )
+        process.start()
+        # O processo tem a sua cópia do extremo de escrita; fechar a do
+        # pai faz com que recv termine com EOFError se o processo morrer
+        # sem enviar um resultado.
+        sender.close()
+        processes[receiver] = strategy, process
+
+    solution, winner, status = None, None, "timeout"
+    results = {}
+    pending = list(processes)
+    try:
+        while pending and winner is None:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                break
+            for receiver in wait(pending, remaining):
+                pending.remove(receiver)
+                strategy, _ = processes[receiver]
+                try:
+                    result_status, result, nodes, seconds = receiver.recv()
+                except EOFError:
+                    result_status, result, nodes, seconds = "error", None, None, None
+                if result_status == "ok" and not is_solution(board, result):
+                    result_status = "wrong"
+                results[strategy] = {
+                    "status": result_status,
+                    "nodes": nodes,
+                    "seconds": seconds,
+                }
+                if result_status == "ok":
+                    solution, winner, status = result, strategy, "ok"
+                    break
+        if winner is None and not pending:
+            unsolvable = any(r["status"] == "unsolvable" for r in results.values())
+            status = "unsolvable" if unsolvable else "error"
+    finally:
+        for receiver, (_, process) in processes.items():
+            if process.is_alive():
+                process.terminate()
+        for receiver, (_, process) in processes.items():
+            process.join()
+            receiver.close()
+
+    return solution, {
+        "size": len(board),
+        "empties": board.empties,
+        "status": status,
+        "winner": winner,
+        "seconds": time.perf_counter() - start,
+        "strategies": list(strategies),
+        "results": results,
+    }
+
+
+def portfolio_stats(log_path: str) -> list:
+    """Resume o registo de resoluções: devolve, para cada estratégia, a
+    lista [estratégia, vitórias, corridas, segundos médios quando ganha],
+    por ordem decrescente de vitórias."""
+    wins = defaultdict(int)
+    runs = defaultdict(int)
+    seconds = defaultdict(float)
+    with open(log_path) as log:
+        for line in log:
+            record = json.loads(line)
+            for strategy in record["strategies"]:
+                runs[strategy] += 1
+            if record["winner"] is not None:
+                wins[record["winner"]] += 1
+                seconds[record["winner"]] += record["seconds"]
+    table = [
+        [
+            strategy,
+            wins[strategy],
+            runs[strategy],
+            round(seconds[strategy] / max(wins[strategy], 1), 3),
+        ]
+        for strategy in runs
+    ]
+    table.sort(key=lambda row: (-row[1], row[3]))
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resolve instâncias de Takuzu com um portefólio de estratégias."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="ficheiros, diretorias ou padrões glob com instâncias a resolver "
+        "(por omissão, o standard input)",
+    )
+    parser.add_argument(
+        "--strategies",
+        nargs="+",
+        default=list(DEFAULT_PORTFOLIO),
+        help="estratégias no formato método:política[:heurística], em que o "
+        "método é um de SOLVERS (takuzu.py) ou uma procura de search.py",
+    )
+    parser.add_argument(
+        "--timeout", type=float, help="tempo limite por instância, em segundos"
+    )
+    parser.add_argument(
+        "--log", help="acrescenta o registo de cada resolução a este ficheiro"
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="LOG",
+        help="mostra as vitórias de cada estratégia no registo dado e termina",
+    )
+    args = parser.parse_args()
+
+    if args.stats:
+        print_table(
+            portfolio_stats(args.stats),
+            ["Strategy", "Wins", "Runs", "Mean win s"],
+        )
+        sys.exit()
+
+    for strategy in args.strategies:
+        try:
+            parse_strategy(strategy)
+        except ValueError as error:
+            parser.error(str(error))
+
+    # Cada resultado é escrito como "# etiqueta estado vencedora segundos",
+    # seguido da solução no formato de entrada (N e as N linhas).
+    for label, board in labelled_instances(args.inputs or ["-"]):
+        solution, record = portfolio_solve(board, args.strategies, args.timeout)
+        record["instance"] = label
+        print(
+            f"# {label} {record['status']} {record['winner']} {record['seconds']:.3f}"
+        )
+        if solution is not None:
+            print(len(solution))
+            print(solution)
+        sys.stdout.flush()
+        if args.log:
+            with open(args.log, "a") as log:
+                log.write(json.dumps(record) + "\n")
@@ -0,0 +1,455 @@
+# sat.py: Codificação de tabuleiros de Takuzu em CNF e solver CDCL.
+#
+# A variável i * N + j + 1 é verdadeira se a posição (i, j) tiver 1. As
+# restrições do Takuzu são codificadas como:
+# - sem três iguais seguidos: para cada janela de três posições, uma
+#   cláusula a proibir três uns e outra a proibir três zeros
+# - contagens: no máximo ceil(N / 2) uns e ceil(N / 2) zeros por linha
+#   e coluna, com contadores sequenciais (Sinz, 2005)
+# - linhas (e colunas) diferentes: para cada par, variáveis auxiliares
+#   d_k que implicam que as duas diferem na posição k, e a cláusula
+#   d_1 v ... v d_N
+#
+# As posições já preenchidas (depois de Board.propagate) são constantes:
+# as cláusulas satisfeitas por elas são omitidas e os literais falsos
+# retirados, o que reduz muito a fórmula.
+#
+#   $ python3 sat.py < tests/input_T13
+#   $ python3 sat.py --dimacs T13.cnf --no-solve < tests/input_T13
+
+import argparse
+import heapq
+import sys
+from collections import defaultdict
+
+from takuzu import Board
+
+
+def negate(literal):
+    """Nega um literal, que pode ser uma constante (True ou False)."""
+    if isinstance(literal, bool):
+        return not literal
+    return -literal
+
+
+class TakuzuCNF:
+    """Fórmula CNF de um tabuleiro de Takuzu."""
+
+    def __init__(self, board: Board):
+        """Codifica o tabuleiro. As posições preenchidas ficam como
+        cláusulas unitárias e como constantes nas restantes cláusulas."""
+        self.n = n = len(board)
+        self.num_vars = n * n
+        self.clauses = []
+        self.unsatisfiable = False
+        self.cells = [
+            [
+                bool(board.get_number(i, j)) if board.get_number(i, j) != 2 else None
+                for j in range(n)
+            ]
+            for i in range(n)
+        ]
+        for i in range(n):
+            for j in range(n):
+                if self.cells[i][j] is not None:
+                    var = self.var(i, j)
+                    self.clauses.append([var if self.cells[i][j] else -var])
+
+        rows = [[self.literal(i, j) for j in range(n)] for i in range(n)]
+        cols = [[self.literal(i, j) for i in range(n)] for j in range(n)]
+        limit = (n + 1) // 2
+        for lines in (rows, cols):
+            for line in lines:
+                for k in range(n - 2):
+                    window = line[k : k + 3]
+                    self.add(window)
+                    self.add([negate(literal) for literal in window])
+                self.at_most(line, limit)
+                self.at_most([negate(literal) for literal in line], limit)
+            for a in range(n):
+                for b in range(a + 1, n):
+                    self.all_different(lines[a], lines[b])
+
+    def var(self, i: int, j: int) -> int:
+        """Devolve a variável da posição (i, j)."""
+        return i * self.n + j + 1
+
+    def literal(self, i: int, j: int):
+        """Devolve a constante da posição (i, j), se estiver preenchida,
+        ou a respetiva variável."""
+        if self.cells[i][j] is not None:
+            return self.cells[i][j]
+        return self.var(i, j)
+
+    def new_var(self) -> int:
+        """Cria uma variável auxiliar."""
+        self.num_vars += 1
+        return self.num_vars
+
+    def add(self, literals):
+        """Acrescenta a cláusula, simplificando as constantes."""
+        if any(literal is True for literal in literals):
+            return
+        clause = [literal for literal in literals if literal is not False]
+        if not clause:
+            self.unsatisfiable = True
+        self.clauses.append(clause)
+
+    def at_most(self, literals, k: int):
+        """Acrescenta as cláusulas de "no máximo k literais verdadeiros",
+        com um contador sequencial sobre os literais não constantes."""
+        k -= sum(literal is True for literal in literals)
+        free = [literal for literal in literals if not isinstance(literal, bool)]
+        if k < 0:
+            self.add([])
+            return
+        if k >= len(free):
+            return
+        if k == 0:
+            for literal in free:
+                self.add([-literal])
+            return
+
+        # counter[j] é verdadeira se pelo menos j + 1 dos literais já
+        # vistos forem verdadeiros.
+        counter = [self.new_var() for _ in range(k)]
+        self.add([-free[0], counter[0]])
+        for j in range(1, k):
+            self.add([-counter[j]])
+        for literal in free[1:-1]:
+            previous = counter
+            counter = [self.new_var() for _ in range(k)]
+            self.add([-literal, counter[0]])
+            self.add([-previous[0], counter[0]])
+            for j in range(1, k):
+                self.add([-literal, -previous[j - 1], counter[j]])
+                self.add([-previous[j], counter[j]])
+            self.add([-literal, -previous[k - 1]])
+        self.add([-free[-1], -counter[k - 1]])
+
+    def all_different(self, line_a, line_b):
+        """Acrescenta as cláusulas de "as duas linhas diferem em pelo
+        menos uma posição"."""
+        differences = []
+        for a, b in zip(line_a, line_b):
+            if isinstance(a, bool) and isinstance(b, bool):
+                if a != b:
+                    return
+                continue
+            d = self.new_var()
+            self.add([-d, a, b])
+            self.add([-d, negate(a), negate(b)])
+            differences.append(d)
+        self.add(differences)
+
+    def decode(self, model) -> Board:
+        """Devolve o tabuleiro correspondente a um modelo (lista indexada
+        pela variável, com valores booleanos)."""
+        n = self.n
+        return Board(
+            tuple(tuple(int(model[self.var(i, j)]) for j in range(n)) for i in range(n))
+        )
+
+    def to_dimacs(self) -> str:
+        """Devolve a fórmula no formato DIMACS CNF."""
+        lines = [
+            f"c takuzu {self.n}x{self.n}: variavel i*{self.n}+j+1 = posicao (i, j) com 1",
+            f"p cnf {self.num_vars} {len(self.clauses)}",
+        ]
+        lines.extend(" ".join(map(str, clause)) + " 0" for clause in self.clauses)
+        return "\n".join(lines) + "\n"
+
+
+def luby(i: int) -> int:
+    """Devolve o i-ésimo termo (a partir de 1) da sequência de Luby:
+    1, 1, 2, 1, 1, 2, 4, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+class CDCLSolver:
+    """Solver SAT CDCL: propagação unitária com dois literais vigiados por
+    cláusula, aprendizagem de cláusulas pelo primeiro ponto de
+    implicação único (1UIP) com retrocesso não cronológico, escolha de
+    variáveis por atividade (VSIDS) com memória de polaridade, e
+    reinícios segundo a sequência de Luby."""
+
+    RESTART_BASE = 100
+    DECAY = 0.95
+
+    def __init__(self, num_vars: int, clauses=(), priority=()):
+        """Cria o solver com as cláusulas dadas. As variáveis de priority
+        (as das posições do tabuleiro) são as primeiras a ser decididas:
+        as auxiliares ficam quase sempre determinadas por propagação."""
+        self.num_vars = num_vars
+        # Valor de cada variável: 1 (verdadeira), -1 (falsa) ou 0.
+        self.values = [0] * (num_vars + 1)
+        self.level = [0] * (num_vars + 1)
+        self.reason = [None] * (num_vars + 1)
+        self.phase = [False] * (num_vars + 1)
+        self.activity = [0.0] * (num_vars + 1)
+        for var in priority:
+            self.activity[var] = 1.0
+        self.increment = 1.0
+        self.order = [(-self.activity[var], var) for var in range(1, num_vars + 1)]
+        heapq.heapify(self.order)
+        self.queued = [True] * (num_vars + 1)
+        self.trail = []
+        self.trail_limits = []
+        self.head = 0
+        # Cláusulas vigiadas por cada literal (as dos seus dois primeiros).
+        self.watches = defaultdict(list)
+        self.ok = True
+        self.conflicts = self.decisions = self.learned = self.restarts = 0
+        for clause in clauses:
+            self.add_clause(clause)
+
+    def value(self, literal: int) -> int:
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def add_clause(self, literals):
+        """Acrescenta uma cláusula ao problema (antes de solve)."""
+        if not self.ok:
+            return
+        clause = []
+        for literal in literals:
+            value = self.value(literal)
+            if value == 1 or -literal in clause:
+                return
+            if value == 0 and literal not in clause:
+                clause.append(literal)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.watches[clause[0]].append(clause)
+            self.watches[clause[1]].append(clause)
+
+    def assign(self, literal: int, reason):
+        var = abs(literal)
+        self.values[var] = 1 if literal > 0 else -1
+        self.level[var] = len(self.trail_limits)
+        self.reason[var] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """Propagação unitária. Devolve a cláusula em conflito, ou None.
+        Numa cláusula que implica um literal, este fica na posição 0."""
+        values = self.values
+        while self.head < len(self.trail):
+            false_literal = -self.trail[self.head]
+            self.head += 1
+            watchers = self.watches[false_literal]
+            kept = []
+            i = 0
+            while i < len(watchers):
+                clause = watchers[i]
+                i += 1
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                first = clause[0]
+                first_value = values[abs(first)] * (1 if first > 0 else -1)
+                if first_value == 1:
+                    kept.append(clause)
+                    continue
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    if values[abs(literal)] * (1 if literal > 0 else -1) != -1:
+                        clause[1], clause[k] = literal, clause[1]
+                        self.watches[literal].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if first_value == -1:
+                        kept.extend(watchers[i:])
+                        self.watches[false_literal] = kept
+                        return clause
+                    self.assign(first, clause)
+            self.watches[false_literal] = kept
+        return None
+
+    def bump(self, var: int):
+        self.activity[var] += self.increment
+        if self.activity[var] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.increment *= 1e-100
+            self.order = [(-self.activity[v], v) for v in range(1, self.num_vars + 1)]
+            heapq.heapify(self.order)
+            self.queued = [True] * (self.num_vars + 1)
+        else:
+            # A entrada anterior da variável fica obsoleta e é ignorada em pick.
+            heapq.heappush(self.order, (-self.activity[var], var))
+            self.queued[var] = True
+
+    def analyze(self, conflict):
+        """Devolve a cláusula aprendida a partir do conflito (com o
+        literal que passa a ser implicado na posição 0) e o nível para
+        onde retroceder."""
+        current_level = len(self.trail_limits)
+        seen = set()
+        learned = [None]
+        pending = 0
+        index = len(self.trail) - 1
+        clause, start = conflict, 0
+        while True:
+            for literal in clause[start:]:
+                var = abs(literal)
+                if var not in seen and self.level[var] > 0:
+                    seen.add(var)
+                    self.bump(var)
+                    if self.level[var] == current_level:
+                        pending += 1
+                    else:
+                        learned.append(literal)
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            index -= 1
+            pending -= 1
+            if not pending:
+                break
+            seen.discard(abs(literal))
+            clause, start = self.reason[abs(literal)], 1
+
+        learned[0] = -literal
+        if len(learned) == 1:
+            return learned, 0
+        # O literal do nível mais alto (depois do implicado) fica vigiado.
+        deepest = max(range(1, len(learned)), key=lambda k: self.level[abs(learned[k])])
+        learned[1], learned[deepest] = learned[deepest], learned[1]
+        return learned, self.level[abs(learned[1])]
+
+    def backtrack(self, level: int):
+        if len(self.trail_limits) <= level:
+            return
+        limit = self.trail_limits[level]
+        for literal in self.trail[limit:]:
+            var = abs(literal)
+            self.values[var] = 0
+            self.reason[var] = None
+            self.phase[var] = literal > 0
+            if not self.queued[var]:
+                heapq.heappush(self.order, (-self.activity[var], var))
+                self.queued[var] = True
+        del self.trail[limit:]
+        del self.trail_limits[level:]
+        self.head = len(self.trail)
+
+    def pick(self):
+        """Devolve o literal da próxima decisão, ou None se todas as
+        variáveis tiverem valor."""
+        while self.order:
+            activity, var = heapq.heappop(self.order)
+            if -activity != self.activity[var]:
+                continue
+            self.queued[var] = False
+            if not self.values[var]:
+                return var if self.phase[var] else -var
+        return None
+
+    def solve(self):
+        """Devolve um modelo (lista de booleanos indexada pela variável)
+        ou None se a fórmula não for satisfazível."""
+        if not self.ok or self.propagate() is not None:
+            return None
+        restart_limit = self.RESTART_BASE * luby(1)
+        conflicts_since_restart = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts_since_restart += 1
+                if not self.trail_limits:
+                    return None
+                learned, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.watches[learned[0]].append(learned)
+                    self.watches[learned[1]].append(learned)
+                    self.assign(learned[0], learned)
+                    self.learned += 1
+                self.increment /= self.DECAY
+                if conflicts_since_restart >= restart_limit:
+                    self.restarts += 1
+                    self.backtrack(0)
+                    conflicts_since_restart = 0
+                    restart_limit = self.RESTART_BASE * luby(self.restarts + 1)
+            else:
+                literal = self.pick()
+                if literal is None:
+                    return [False] + [value == 1 for value in self.values[1:]]
+                self.decisions += 1
+                self.trail_limits.append(len(self.trail))
+                self.assign(literal, None)
+
+
+def sat_solve(board: Board):
+    """Resolve o tabuleiro codificando-o em CNF (depois de propagar as
+    deduções) e usando o CDCLSolver. Devolve o par (tabuleiro resolvido
+    ou None, decisões do solver)."""
+    board = board.copy()
+    if not board.propagate():
+        return None, 0
+    cnf = TakuzuCNF(board)
+    if cnf.unsatisfiable:
+        return None, 0
+    solver = CDCLSolver(cnf.num_vars, cnf.clauses, range(1, cnf.n * cnf.n + 1))
+    model = solver.solve()
+    if model is None:
+        return None, solver.decisions
+    return cnf.decode(model), solver.decisions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resolve uma instância de Takuzu com o solver SAT."
+    )
+    parser.add_argument("--dimacs", help="escreve a fórmula CNF neste ficheiro")
+    parser.add_argument(
+        "--no-solve", action="store_true", help="apenas escreve a fórmula"
+    )
+    parser.add_argument(
+        "--propagate",
+        action="store_true",
+        help="codifica o tabuleiro depois de aplicar as deduções",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="escreve no stderr o tamanho da fórmula e as estatísticas do solver",
+    )
+    args = parser.parse_args()
+
+    board = Board.parse_instance_from_stdin()
+    if args.propagate:
+        board = board.copy()
+        board.propagate()
+    cnf = TakuzuCNF(board)
+    if args.dimacs:
+        with open(args.dimacs, "w") as output:
+            output.write(cnf.to_dimacs())
+    if args.no_solve:
+        sys.exit()
+
+    solver = CDCLSolver(cnf.num_vars, cnf.clauses, range(1, cnf.n * cnf.n + 1))
+    model = None if cnf.unsatisfiable else solver.solve()
+    print(cnf.decode(model) if model else "sem solução")
+    if args.stats:
+        print(
+            f"variáveis: {cnf.num_vars} cláusulas: {len(cnf.clauses)} "
+            f"decisões: {solver.decisions} conflitos: {solver.conflicts} "
+            f"aprendidas: {solver.learned} reinícios: {solver.restarts}",
+            file=sys.stderr,
+        )
@@ -6,7 +6,11 @@ then create problem instances and solve them with calls to the various search
 functions.
 """
 
+import functools
+import json
 import sys
+import threading
+import time
 from collections import deque
 
 from utils import *
@@ -177,11 +181,119 @@ class SimpleProblemSolvingAgentProgram:
         raise NotImplementedError
 
 
+# ______________________________________________________________________________
+# Search budgets
+
+
+class BudgetExhausted(Exception):
+    """Raised by Budget.charge when a limit is reached; status tells which."""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class Budget:
+    """Limits for a search: a time limit in seconds, a maximum number of
+    expanded nodes, a maximum frontier size and a cancellation flag, which
+    may be set from another thread (or process, if a multiprocessing Event
+    is given) with cancel(). Searchers call charge once per expanded node,
+    with the size of their frontier; the recursive searchers
+    (depth_limited_search, iterative_deepening_search and
+    recursive_best_first_search) keep no frontier and give the recursion
+    depth instead. The clock starts when the search starts, and the budget
+    also keeps the deepest node reached so far as the best partial
+    solution."""
+
+    def __init__(self, seconds=None, max_nodes=None, max_frontier=None, event=None):
+        self.seconds = seconds
+        self.max_nodes = max_nodes
+        self.max_frontier = max_frontier
+        self.event = event if event is not None else threading.Event()
+        self.deadline = None
+        self.nodes = 0
+        self.best = None
+        self.running = False
+
+    def cancel(self):
+        """Ask the search to stop at the next node it expands."""
+        self.event.set()
+
+    def start(self):
+        self.nodes = 0
+        self.best = None
+        self.running = True
+        if self.seconds is not None:
+            self.deadline = time.monotonic() + self.seconds
+
+    def charge(self, node, frontier_size=0):
+        """Count the expansion of node, or raise BudgetExhausted if a limit
+        has been reached."""
+        if self.event.is_set():
+            raise BudgetExhausted("cancelled")
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise BudgetExhausted("node_limit")
+        if self.max_frontier is not None and frontier_size > self.max_frontier:
+            raise BudgetExhausted("frontier_limit")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExhausted("timeout")
+        self.nodes += 1
+        if self.best is None or node.depth > self.best.depth:
+            self.best = node
+
+
+class SearchResult:
+    """Outcome of a search run with a budget. status is "solved", "failed"
+    (the search space was exhausted without a goal), "cutoff" (only for
+    depth_limited_search) or the limit that stopped the search: "timeout",
+    "node_limit", "frontier_limit" or "cancelled". node is the goal node
+    (or None), nodes the number of expanded nodes and best the deepest
+    node reached."""
+
+    def __init__(self, status, node=None, nodes=0, best=None):
+        self.status = status
+        self.node = node
+        self.nodes = nodes
+        self.best = best
+
+    def __repr__(self):
+        return "<SearchResult {} nodes={}>".format(self.status, self.nodes)
+
+
+def bounded(search):
+    """Decorator for search functions that take a budget keyword argument.
+    Without a budget the search returns what it always did (a node, None
+    or "cutoff"); with one it returns a SearchResult, also when the budget
+    runs out. Searches called from a bounded search with the same budget
+    (astar_search calling best_first_graph_search, for instance) share it
+    and return their plain result to the caller."""
+
+    @functools.wraps(search)
+    def wrapper(problem, *args, budget=None, **kwargs):
+        if budget is None or budget.running:
+            return search(problem, *args, budget=budget, **kwargs)
+        budget.start()
+        try:
+            result = search(problem, *args, budget=budget, **kwargs)
+        except BudgetExhausted as exhausted:
+            return SearchResult(exhausted.status, None, budget.nodes, budget.best)
+        finally:
+            budget.running = False
+        if result is None:
+            return SearchResult("failed", None, budget.nodes, budget.best)
+        if isinstance(result, str):
+            return SearchResult(result, None, budget.nodes, budget.best)
+        return SearchResult("solved", result, budget.nodes, result)
+
+    return wrapper
+
+
 # ______________________________________________________________________________
 # Uninformed Search algorithms
 
 
-def breadth_first_tree_search(problem):
+@bounded
+def breadth_first_tree_search(problem, budget=None):
     """
     [Figure 3.7]
     Search the shallowest nodes in the search tree first.
@@ -191,16 +303,23 @@ def breadth_first_tree_search(problem):
     """
 
     frontier = deque([Node(problem.initial)])  # FIFO queue
+    # Optional hook (see InstrumentedProblem) called with the frontier size.
+    observe = getattr(problem, "observe_frontier", None)
 
     while frontier:
+        if observe:
+            observe(len(frontier))
         node = frontier.popleft()
         if problem.goal_test(node.state):
             return node
+        if budget is not None:
+            budget.charge(node, len(frontier))
         frontier.extend(node.expand(problem))
     return None
 
 
-def depth_first_tree_search(problem):
+@bounded
+def depth_first_tree_search(problem, budget=None):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
@@ -210,16 +329,22 @@ def depth_first_tree_search(problem):
     """
 
     frontier = [Node(problem.initial)]  # Stack
+    observe = getattr(problem, "observe_frontier", None)
 
     while frontier:
+        if observe:
+            observe(len(frontier))
         node = frontier.pop()
         if problem.goal_test(node.state):
             return node
+        if budget is not None:
+            budget.charge(node, len(frontier))
         frontier.extend(node.expand(problem))
     return None
 
 
-def depth_first_graph_search(problem):
+@bounded
+def depth_first_graph_search(problem, budget=None):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
@@ -229,22 +354,31 @@ def depth_first_graph_search(problem):
     If two paths reach a state, only use the first one.
     """
     frontier = [(Node(problem.initial))]  # Stack
+    # States in the frontier, so that membership tests use the state hash
+    # instead of scanning the stack.
+    frontier_states = {frontier[0].state}
+    observe = getattr(problem, "observe_frontier", None)
 
     explored = set()
     while frontier:
+        if observe:
+            observe(len(frontier))
         node = frontier.pop()
+        frontier_states.discard(node.state)
         if problem.goal_test(node.state):
             return node
+        if budget is not None:
+            budget.charge(node, len(frontier))
         explored.add(node.state)
-        frontier.extend(
-            child
-            for child in node.expand(problem)
-            if child.state not in explored and child not in frontier
-        )
+        for child in node.expand(problem):
+            if child.state not in explored and child.state not in frontier_states:
+                frontier.append(child)
+                frontier_states.add(child.state)
     return None
 
 
-def breadth_first_graph_search(problem):
+@bounded
+def breadth_first_graph_search(problem, budget=None):
     """[Figure 3.11]
     Note that this function can be implemented in a
     single line as below:
@@ -254,19 +388,28 @@ def breadth_first_graph_search(problem):
     if problem.goal_test(node.state):
         return node
     frontier = deque([node])
+    frontier_states = {node.state}
+    observe = getattr(problem, "observe_frontier", None)
     explored = set()
     while frontier:
+        if observe:
+            observe(len(frontier))
         node = frontier.popleft()
+        frontier_states.discard(node.state)
+        if budget is not None:
+            budget.charge(node, len(frontier))
         explored.add(node.state)
         for child in node.expand(problem):
-            if child.state not in explored and child not in frontier:
+            if child.state not in explored and child.state not in frontier_states:
                 if problem.goal_test(child.state):
                     return child
                 frontier.append(child)
+                frontier_states.add(child.state)
     return None
 
 
-def best_first_graph_search(problem, f, display=False):
+@bounded
+def best_first_graph_search(problem, f, display=False, budget=None):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
@@ -278,8 +421,11 @@ def best_first_graph_search(problem, f, display=False):
     node = Node(problem.initial)
     frontier = PriorityQueue("min", f)
     frontier.append(node)
+    observe = getattr(problem, "observe_frontier", None)
     explored = set()
     while frontier:
+        if observe:
+            observe(len(frontier))
         node = frontier.pop()
         if problem.goal_test(node.state):
             if display:
@@ -290,6 +436,8 @@ def best_first_graph_search(problem, f, display=False):
                     "paths remain in the frontier",
                 )
             return node
+        if budget is not None:
+            budget.charge(node, len(frontier))
         explored.add(node.state)
         for child in node.expand(problem):
             if child.state not in explored and child not in frontier:
@@ -301,12 +449,16 @@ def best_first_graph_search(problem, f, display=False):
     return None
 
 
-def uniform_cost_search(problem, display=False):
+@bounded
+def uniform_cost_search(problem, display=False, budget=None):
     """[Figure 3.14]"""
-    return best_first_graph_search(problem, lambda node: node.path_cost, display)
+    return best_first_graph_search(
+        problem, lambda node: node.path_cost, display, budget=budget
+    )
 
 
-def depth_limited_search(problem, limit=50):
+@bounded
+def depth_limited_search(problem, limit=50, budget=None):
     """[Figure 3.17]"""
 
     def recursive_dls(node, problem, limit):
@@ -315,6 +467,8 @@ def depth_limited_search(problem, limit=50):
         elif limit == 0:
             return "cutoff"
         else:
+            if budget is not None:
+                budget.charge(node, node.depth)
             cutoff_occurred = False
             for child in node.expand(problem):
                 result = recursive_dls(child, problem, limit - 1)
@@ -328,10 +482,11 @@ def depth_limited_search(problem, limit=50):
     return recursive_dls(Node(problem.initial), problem, limit)
 
 
-def iterative_deepening_search(problem):
+@bounded
+def iterative_deepening_search(problem, budget=None):
     """[Figure 3.18]"""
     for depth in range(sys.maxsize):
-        result = depth_limited_search(problem, depth)
+        result = depth_limited_search(problem, depth, budget=budget)
         if result != "cutoff":
             return result
 
@@ -425,18 +580,22 @@ greedy_best_first_graph_search = best_first_graph_search
 
 
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
-def greedy_search(problem, h=None):
+@bounded
+def greedy_search(problem, h=None, budget=None):
     """f(n) = h(n)"""
     h = memoize(h or problem.h, "h")
-    return best_first_graph_search(problem, h)
+    return best_first_graph_search(problem, h, budget=budget)
 
 
-def astar_search(problem, h=None, display=False):
+@bounded
+def astar_search(problem, h=None, display=False, budget=None):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = memoize(h or problem.h, "h")
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display)
+    return best_first_graph_search(
+        problem, lambda n: n.path_cost + h(n), display, budget=budget
+    )
 
 
 # ______________________________________________________________________________
@@ -620,13 +779,16 @@ class PlanRoute(Problem):
 # Other search algorithms
 
 
-def recursive_best_first_search(problem, h=None):
+@bounded
+def recursive_best_first_search(problem, h=None, budget=None):
     """[Figure 3.26]"""
     h = memoize(h or problem.h, "h")
 
     def RBFS(problem, node, flimit):
         if problem.goal_test(node.state):
             return node, 0  # (The second value is immaterial)
+        if budget is not None:
+            budget.charge(node, node.depth)
         successors = node.expand(problem)
         if len(successors) == 0:
             return None, np.inf
@@ -1603,12 +1765,59 @@ def mutate_boggle(board):
 
 
 class InstrumentedProblem(Problem):
-    """Delegates to a problem, and keeps statistics."""
-
-    def __init__(self, problem):
+    """Delegates to a problem, and keeps statistics.
+
+    With profile=True it also times every delegated call (actions, result,
+    goal_test, path_cost, value and h) with time.perf_counter_ns, records
+    the frontier size each time a search pops a node (searches look for an
+    observe_frontier method), and hands a dict to the wrapped problem's
+    counters attribute, if it has one, for its own named statistics as
+    [calls, nanoseconds, items] (Takuzu uses it for the deduction rules).
+    With trace=True every timed call is also kept as an event, so that
+    write_trace can export a Chrome trace (chrome://tracing, Perfetto or
+    speedscope). Both are off by default, and then the problem is wrapped
+    exactly as before: no method is replaced and nothing is timed."""
+
+    TIMED = ("actions", "result", "goal_test", "path_cost", "value", "h")
+
+    def __init__(self, problem, profile=False, trace=False):
         self.problem = problem
         self.succs = self.goal_tests = self.states = 0
         self.found = None
+        self.profile = profile or trace
+        self.timings = {}
+        self.counters = {}
+        self.frontier = []
+        self.events = [] if trace else None
+        self.start_ns = time.perf_counter_ns()
+        if self.profile:
+            for method in self.TIMED:
+                setattr(self, method, self.timed(method, getattr(self, method)))
+            self.observe_frontier = self.record_frontier
+            if hasattr(problem, "counters"):
+                problem.counters = self.counters
+
+    def timed(self, name, method):
+        """Return method wrapped so that each call adds to self.timings[name]
+        (calls, total nanoseconds) and, when tracing, to self.events."""
+        timing = self.timings.setdefault(name, [0, 0])
+        events = self.events
+        clock = time.perf_counter_ns
+
+        def timed_method(*args):
+            start = clock()
+            result = method(*args)
+            elapsed = clock() - start
+            timing[0] += 1
+            timing[1] += elapsed
+            if events is not None:
+                events.append((name, start, elapsed))
+            return result
+
+        return timed_method
+
+    def record_frontier(self, size):
+        self.frontier.append((time.perf_counter_ns(), size))
 
     def actions(self, state):
         self.succs += 1
@@ -1631,6 +1840,86 @@ class InstrumentedProblem(Problem):
     def value(self, state):
         return self.problem.value(state)
 
+    def h(self, node):
+        return self.problem.h(node)
+
+    def summary(self):
+        """Return the profile as a list of rows [name, calls, total ms,
+        mean us, items]: the timed methods, then the problem's counters."""
+        rows = []
+        for name, (calls, elapsed) in self.timings.items():
+            if calls:
+                rows.append(
+                    [
+                        name,
+                        calls,
+                        round(elapsed / 1e6, 3),
+                        round(elapsed / calls / 1e3, 3),
+                        "-",
+                    ]
+                )
+        for name, (calls, elapsed, items) in sorted(self.counters.items()):
+            rows.append(
+                [
+                    name,
+                    calls,
+                    round(elapsed / 1e6, 3),
+                    round(elapsed / max(calls, 1) / 1e3, 3),
+                    items,
+                ]
+            )
+        return rows
+
+    def print_summary(self):
+        """Print the profile table and the frontier sizes."""
+        print_table(self.summary(), ["Method", "Calls", "Total ms", "Mean us", "Items"])
+        if self.frontier:
+            sizes = [size for _, size in self.frontier]
+            print(
+                "frontier: {} samples, max {}, last {}".format(
+                    len(sizes), max(sizes), sizes[-1]
+                )
+            )
+
+    def write_trace(self, path):
+        """Write the recorded calls and frontier sizes to path as a Chrome
+        trace (JSON), with timestamps in microseconds since the problem was
+        wrapped and the profile summary in otherData."""
+
+        def us(ns):
+            return (ns - self.start_ns) / 1e3
+
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": us(start),
+                "dur": elapsed / 1e3,
+                "pid": 0,
+                "tid": 0,
+            }
+            for name, start, elapsed in self.events or ()
+        ]
+        events += [
+            {
+                "name": "frontier",
+                "ph": "C",
+                "ts": us(at),
+                "pid": 0,
+                "args": {"size": size},
+            }
+            for at, size in self.frontier
+        ]
+        with open(path, "w") as output:
+            json.dump(
+                {
+                    "traceEvents": events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"summary": self.summary()},
+                },
+                output,
+            )
+
     def __getattr__(self, attr):
         return getattr(self.problem, attr)
 
@@ -6,8 +6,22 @@
 # 99188 Carlos Vaz
 # 99268 Mafalda Ribeiro
 
+import argparse
+import glob
+import math
+import mmap
+import os
+import random
+import signal
 import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+
 import numpy as np
+from cache import CACHE_SIZE, ResultCache
+from patterns import MAX_PATTERN_SIZE, line_candidates, pattern_store
 from search import (
     Problem,
     Node,
@@ -30,97 +44,325 @@ class TakuzuState:
     def __lt__(self, other):
         return self.id < other.id
 
+    def __eq__(self, other):
+        return isinstance(other, TakuzuState) and self.board == other.board
+
+    def __hash__(self):
+        return hash(self.board)
+
 
 class Board:
-    """Representação interna de um tabuleiro de Takuzu."""
+    """Representação interna de um tabuleiro de Takuzu.
+
+    Cada linha e cada coluna é guardada como um par de máscaras de bits
+    (posições preenchidas, posições com 1), em que o bit j corresponde à
+    posição j da linha ou coluna. As contagens de zeros, uns e posições
+    vazias de cada linha ou coluna obtêm-se das máscaras. O tabuleiro
+    mantém ainda o número de posições vazias, o conjunto das linhas e
+    colunas completas e um hash de Zobrist do conteúdo (ver
+    zobrist_table), atualizados a cada jogada."""
 
     def __init__(self, board):
-        """Inicializa um tabuleiro vazio."""
-        self.board = board
+        """Inicializa o tabuleiro a partir de um tuplo de tuplos."""
+        n = len(board)
+        self.n = n
+        self.row_filled = [0] * n
+        self.row_ones = [0] * n
+        self.col_filled = [0] * n
+        self.col_ones = [0] * n
+        self.empties = n * n
+        # Linhas e colunas completas (máscara de uns -> repetições) e número
+        # de linhas ou colunas completas iguais a outra anterior.
+        self.row_signatures = {}
+        self.col_signatures = {}
+        self.duplicate = 0
+        self.contradiction = False
+        self.conflict_line = None
+        self.hash = 0
+        self.zobrist = zobrist_table(n)
+        for i in range(n):
+            for j in range(n):
+                if board[i][j] != 2:
+                    self.set_number(i, j, board[i][j])
+
+    def copy(self):
+        """Devolve uma cópia do tabuleiro."""
+        new = Board.__new__(Board)
+        new.n = self.n
+        new.row_filled = self.row_filled.copy()
+        new.row_ones = self.row_ones.copy()
+        new.col_filled = self.col_filled.copy()
+        new.col_ones = self.col_ones.copy()
+        new.empties = self.empties
+        new.row_signatures = self.row_signatures.copy()
+        new.col_signatures = self.col_signatures.copy()
+        new.duplicate = self.duplicate
+        new.contradiction = self.contradiction
+        new.conflict_line = self.conflict_line
+        new.hash = self.hash
+        new.zobrist = self.zobrist
+        return new
+
+    @property
+    def board(self):
+        """Devolve o tabuleiro como tuplo de tuplos."""
+        return self.get_rows()
+
+    @property
+    def full_mask(self) -> int:
+        """Devolve a máscara de uma linha ou coluna completamente preenchida."""
+        return (1 << self.n) - 1
 
     def __len__(self):
         """Devolve a dimensão (N) do tabuleiro N x N"""
-        return len(self.board)
+        return self.n
+
+    def __eq__(self, other):
+        """Dois tabuleiros são iguais se tiverem o mesmo conteúdo."""
+        return (
+            isinstance(other, Board)
+            and self.hash == other.hash
+            and self.row_filled == other.row_filled
+            and self.row_ones == other.row_ones
+        )
+
+    def __hash__(self):
+        """Devolve o hash de Zobrist, mantido a cada jogada."""
+        return self.hash
+
+    def __getstate__(self):
+        """A tabela de Zobrist não é serializada (é igual em todos os
+        processos), para que os tabuleiros enviados entre processos
+        tenham apenas as máscaras e contadores."""
+        state = self.__dict__.copy()
+        del state["zobrist"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.zobrist = zobrist_table(self.n)
+
+    def to_bytes(self) -> bytes:
+        """Devolve uma representação compacta do conteúdo do tabuleiro: N
+        (2 bytes) e, para cada linha, as máscaras de posições preenchidas
+        e de uns, com ceil(N / 8) bytes cada (401 bytes para N = 40)."""
+        width = (self.n + 7) // 8
+        parts = [self.n.to_bytes(2, "little")]
+        for filled, ones in zip(self.row_filled, self.row_ones):
+            parts.append(filled.to_bytes(width, "little"))
+            parts.append(ones.to_bytes(width, "little"))
+        return b"".join(parts)
+
+    @staticmethod
+    def from_bytes(data: bytes):
+        """Reconstrói um tabuleiro a partir da representação de to_bytes.
+        As deduções não são refeitas: o tabuleiro fica com as mesmas
+        posições preenchidas que o original."""
+        n = int.from_bytes(data[:2], "little")
+        width = (n + 7) // 8
+        rows = []
+        for i in range(n):
+            start = 2 + 2 * width * i
+            filled = int.from_bytes(data[start : start + width], "little")
+            ones = int.from_bytes(data[start + width : start + 2 * width], "little")
+            rows.append(
+                tuple(ones >> j & 1 if filled >> j & 1 else 2 for j in range(n))
+            )
+        return Board(tuple(rows))
 
     def __str__(self):
         """Retorna representação externa do tabuleiro"""
-        return "\n".join("\t".join(map(str, row)) for row in self.board)
+        return "\n".join("\t".join(map(str, row)) for row in self.get_rows())
+
+    def set_number(self, row: int, col: int, number: int):
+        """Coloca o número na respetiva posição (que tem de estar vazia),
+        alterando o tabuleiro."""
+        bit_col = 1 << col
+        bit_row = 1 << row
+        self.row_filled[row] |= bit_col
+        self.col_filled[col] |= bit_row
+        if number == 1:
+            self.row_ones[row] |= bit_col
+            self.col_ones[col] |= bit_row
+        self.empties -= 1
+        self.hash ^= self.zobrist[2 * (row * self.n + col) + number]
+
+        full = self.full_mask
+        if self.row_filled[row] == full:
+            self.add_signature(self.row_signatures, self.row_ones[row])
+        if self.col_filled[col] == full:
+            self.add_signature(self.col_signatures, self.col_ones[col])
+
+    def unset_number(self, row: int, col: int):
+        """Apaga o número da respetiva posição (que tem de estar
+        preenchida), desfazendo set_number."""
+        full = self.full_mask
+        if self.row_filled[row] == full:
+            self.remove_signature(self.row_signatures, self.row_ones[row])
+        if self.col_filled[col] == full:
+            self.remove_signature(self.col_signatures, self.col_ones[col])
+
+        number = (self.row_ones[row] >> col) & 1
+        bit_col = 1 << col
+        bit_row = 1 << row
+        self.row_filled[row] &= ~bit_col
+        self.col_filled[col] &= ~bit_row
+        self.row_ones[row] &= ~bit_col
+        self.col_ones[col] &= ~bit_row
+        self.empties += 1
+        self.hash ^= self.zobrist[2 * (row * self.n + col) + number]
+
+    def undo(self, trail: list, length: int):
+        """Apaga as posições registadas em trail depois das primeiras
+        length, pela ordem inversa, e limpa a marca de contradição."""
+        while len(trail) > length:
+            self.unset_number(*trail.pop())
+        self.contradiction = False
+
+    def add_signature(self, signatures: dict, ones: int):
+        """Regista uma linha ou coluna completa, assinalando se já
+        existia outra igual."""
+        if ones in signatures:
+            self.duplicate += 1
+            signatures[ones] += 1
+        else:
+            signatures[ones] = 1
+
+    def duplicate_line(self) -> int | None:
+        """Devolve uma linha (ou coluna, N + coluna) completa igual a
+        outra, ou None se não houver."""
+        full = self.full_mask
+        for line in range(2 * self.n):
+            filled, ones = self.line_masks(line)
+            signatures = self.row_signatures if line < self.n else self.col_signatures
+            if filled == full and signatures[ones] > 1:
+                return line
+        return None
+
+    def remove_signature(self, signatures: dict, ones: int):
+        """Retira o registo de uma linha ou coluna completa."""
+        if signatures[ones] > 1:
+            self.duplicate -= 1
+            signatures[ones] -= 1
+        else:
+            del signatures[ones]
 
     def move_result(self, row: int, col: int, number: int):
         """Devolve o tabuleiro resultante da jogada recebida."""
-        newBoard = ()
-        for i in range(len(self.board)):
-            if i == row:
-                newRow = ()
-                for j in range(len(self.board)):
-                    if j == col:
-                        newRow += (number,)
-                    else:
-                        newRow += (self.board[i][j],)
-                newBoard += (newRow,)
-            else:
-                newBoard += (self.board[i],)
-
-        return Board(newBoard)
+        new_board = self.copy()
+        new_board.set_number(row, col, number)
+        return new_board
 
     def get_row(self, row: int):
         """Devolve a respetiva linha do tabuleiro"""
-        return self.board[row]
+        return self.mask_to_tuple(self.row_filled[row], self.row_ones[row])
 
     def get_col(self, col: int):
         """Devolve a respetiva coluna do tabuleiro"""
-        tup = ()
-        for i in range(len(self.board)):
-            tup += (self.board[i][col],)
-
-        return tup
+        return self.mask_to_tuple(self.col_filled[col], self.col_ones[col])
 
     def get_rows(self):
         """Devolve tuplo contendo as linhas do tabuleiro"""
-        lines = ()
-        for i in range(len(self.board)):
-            lines += (self.get_row(i),)
-        return lines
+        return tuple(self.get_row(i) for i in range(self.n))
 
     def get_cols(self):
         """Devolve tuplo contendo as colunas do tabuleiro"""
-        cols = ()
-        for i in range(len(self.board)):
-            cols += (self.get_col(i),)
-        return cols
+        return tuple(self.get_col(j) for j in range(self.n))
+
+    def to_array(self) -> np.ndarray:
+        """Devolve o tabuleiro como array N x N de int8 (2 nas posições
+        vazias)."""
+        positions = np.arange(self.n, dtype=np.uint64)
+        filled = np.array(self.row_filled, dtype=np.uint64)[:, None] >> positions
+        ones = np.array(self.row_ones, dtype=np.uint64)[:, None] >> positions
+        return np.where(filled & 1, ones & 1, 2).astype(np.int8)
+
+    def reverse_mask(self, mask: int) -> int:
+        """Devolve a máscara de uma linha ou coluna lida ao contrário."""
+        return int(f"{mask:0{self.n}b}"[::-1], 2)
+
+    def symmetric_masks(self, symmetry: tuple) -> list:
+        """Devolve as máscaras (preenchidas, uns) das linhas do tabuleiro
+        transformado pela simetria dada (ver SYMMETRIES)."""
+        transpose, mirror, flip, swap = symmetry
+        if transpose:
+            rows = list(zip(self.col_filled, self.col_ones))
+        else:
+            rows = list(zip(self.row_filled, self.row_ones))
+        if mirror:
+            rows = [(self.reverse_mask(f), self.reverse_mask(o)) for f, o in rows]
+        if flip:
+            rows.reverse()
+        if swap:
+            rows = [(f, f ^ o) for f, o in rows]
+        return rows
+
+    def transformed(self, symmetry: tuple, inverse=False):
+        """Devolve o tabuleiro transformado pela simetria dada, ou pela
+        sua inversa (se inverse)."""
+        if inverse:
+            symmetry = inverse_symmetry(symmetry)
+        return Board(
+            tuple(self.mask_to_tuple(f, o) for f, o in self.symmetric_masks(symmetry))
+        )
+
+    def canonical_form(self) -> (tuple, tuple):
+        """Devolve a forma canónica do tabuleiro e a simetria que a
+        produz. Cada linha é codificada num inteiro (preenchidas << N |
+        uns) e a forma canónica é o menor tuplo dessas codificações sobre
+        as 16 simetrias, pelo que os tabuleiros que diferem por uma
+        rotação, reflexão ou troca de 0 e 1 têm a mesma forma canónica."""
+        n = self.n
+        return min(
+            (tuple((f << n) | o for f, o in self.symmetric_masks(symmetry)), symmetry)
+            for symmetry in SYMMETRIES
+        )
+
+    def mask_to_tuple(self, filled: int, ones: int) -> tuple:
+        """Converte as máscaras de uma linha ou coluna num tuplo."""
+        return tuple((ones >> j) & 1 if (filled >> j) & 1 else 2 for j in range(self.n))
+
+    @staticmethod
+    def tuple_to_mask(tup: tuple) -> (int, int):
+        """Converte um tuplo nas máscaras (preenchidas, uns) respetivas."""
+        filled = ones = 0
+        for j, value in enumerate(tup):
+            if value != 2:
+                filled |= 1 << j
+                if value == 1:
+                    ones |= 1 << j
+        return filled, ones
 
     def all_diff(self, tups) -> bool:
         """Devolve True se todos os subtuplos preenchidos forem diferentes uns dos outros."""
-        trimmed_tups = ()
-        for tup in tups:
-            if tup.count(2) == 0:
-                trimmed_tups += (tup,)
-
+        trimmed_tups = [tup for tup in tups if 2 not in tup]
         return len(set(trimmed_tups)) == len(trimmed_tups)
 
     def get_number(self, row: int, col: int) -> int:
         """Devolve o valor na respetiva posição do tabuleiro."""
-        return self.board[row][col]
+        if not (self.row_filled[row] >> col) & 1:
+            return 2
+        return (self.row_ones[row] >> col) & 1
 
     def adjacent_vertical_numbers(self, row: int, col: int) -> (int, int):
         """Devolve os valores imediatamente abaixo e acima,
         respectivamente."""
         if row == 0:
-            return (self.board[row + 1][col], None)
-        elif row == len(self.board) - 1:
-            return (None, self.board[row - 1][col])
+            return (self.get_number(row + 1, col), None)
+        elif row == self.n - 1:
+            return (None, self.get_number(row - 1, col))
         else:
-            return (self.board[row + 1][col], self.board[row - 1][col])
+            return (self.get_number(row + 1, col), self.get_number(row - 1, col))
 
     def adjacent_horizontal_numbers(self, row: int, col: int) -> (int, int):
         """Devolve os valores imediatamente à esquerda e à direita,
         respectivamente."""
         if col == 0:
-            return (None, self.board[row][col + 1])
-        elif col == len(self.board) - 1:
-            return (self.board[row][col - 1], None)
+            return (None, self.get_number(row, col + 1))
+        elif col == self.n - 1:
+            return (self.get_number(row, col - 1), None)
         else:
-            return (self.board[row][col - 1], self.board[row][col + 1])
+            return (self.get_number(row, col - 1), self.get_number(row, col + 1))
 
     def check_equal_adjacent(self, row: int, col: int) -> int:
         """Devolve o número a preencher caso os números adjacentes sejam
@@ -141,24 +383,35 @@ class Board:
         else:
             return 2
 
+    def first_empty(self, filled: int) -> int:
+        """Devolve a primeira posição vazia da linha ou coluna com a
+        máscara dada, ou -1 se estiver completa."""
+        empty = self.full_mask & ~filled
+        return (empty & -empty).bit_length() - 1
+
     def is_valid_adjacent(self, tup: tuple) -> bool:
         """Devolve True se a linha ou coluna não tiver mais do
         que dois números iguais adjacentes."""
-        for i in range(2, len(tup)):
-            if (tup[i - 2] == tup[i - 1] == tup[i]) and tup[i] != 2:
-                return False
+        return self.is_valid_adjacent_mask(*self.tuple_to_mask(tup))
 
-        return True
+    @staticmethod
+    def is_valid_adjacent_mask(filled: int, ones: int) -> bool:
+        """Devolve True se a linha ou coluna, dada pelas suas máscaras,
+        não tiver mais do que dois números iguais adjacentes."""
+        zeros = filled & ~ones
+        return not (ones & (ones >> 1) & (ones >> 2)) and not (
+            zeros & (zeros >> 1) & (zeros >> 2)
+        )
 
     def is_valid_adjacents(self) -> bool:
         """Devolve True se cada linha e coluna não tiver mais do
         que dois números iguais adjacentes."""
-        for row in self.get_rows():
-            if not self.is_valid_adjacent(row):
+        for filled, ones in zip(self.row_filled, self.row_ones):
+            if not self.is_valid_adjacent_mask(filled, ones):
                 return False
 
-        for col in self.get_cols():
-            if not self.is_valid_adjacent(col):
+        for filled, ones in zip(self.col_filled, self.col_ones):
+            if not self.is_valid_adjacent_mask(filled, ones):
                 return False
 
         return True
@@ -166,93 +419,81 @@ class Board:
     def is_valid_count(self, tup: tuple) -> bool:
         """Devolve True se o número de zeros e uns da linha ou
         coluna é válido de acordo com as restrições do problema."""
-        zeros = tup.count(0)
-        ones = tup.count(1)
-        return True if abs(zeros - ones) < 2 else False
+        return self.is_valid_count_mask(*self.tuple_to_mask(tup))
 
-    def check_counter_row(self, row_number: int) -> int:
+    @staticmethod
+    def is_valid_count_mask(filled: int, ones: int) -> bool:
+        """Devolve True se o número de zeros e uns da linha ou coluna,
+        dada pelas suas máscaras, é válido."""
+        n_ones = ones.bit_count()
+        n_zeros = filled.bit_count() - n_ones
+        return abs(n_zeros - n_ones) < 2
+
+    def check_counter(self, filled: int, ones: int) -> int:
         """Devolve o número a preencher caso o número de zeros ou uns
-        já tenha chegado ao limite da linha. Caso nenhum tenha
-        chegado ao limite, devolve 2."""
-
-        row = self.get_row(row_number)
-        limit = np.ceil(len(self.board) / 2)
-        if row.count(0) == limit:
+        da linha ou coluna dada pelas máscaras já tenha chegado ao
+        limite. Caso nenhum tenha chegado ao limite, devolve 2."""
+        limit = (self.n + 1) // 2
+        n_ones = ones.bit_count()
+        if filled.bit_count() - n_ones == limit:
             return 1
-        elif row.count(1) == limit:
+        elif n_ones == limit:
             return 0
         else:
             return 2
 
+    def check_counter_row(self, row_number: int) -> int:
+        """Devolve o número a preencher caso o número de zeros ou uns
+        já tenha chegado ao limite da linha. Caso nenhum tenha
+        chegado ao limite, devolve 2."""
+        return self.check_counter(
+            self.row_filled[row_number], self.row_ones[row_number]
+        )
+
     def check_counter_col(self, col_number: int) -> int:
         """Devolve o número a preencher caso o número de zeros ou uns
         já tenha chegado ao limite da coluna. Caso nenhum tenha
         chegado ao limite, devolve 2."""
-
-        col = self.get_col(col_number)
-        limit = np.ceil(len(self.board) / 2)
-        if col.count(0) == limit:
-            return 1
-        elif col.count(1) == limit:
-            return 0
-        else:
-            return 2
+        return self.check_counter(
+            self.col_filled[col_number], self.col_ones[col_number]
+        )
+
+    def two_adjacents(self, filled: int, ones: int) -> list:
+        """Devolve pares (posição, número) a preencher nas posições
+        vazias que ladeiam dois números iguais seguidos na linha ou
+        coluna dada pelas máscaras."""
+        moves = []
+        empty = self.full_mask & ~filled
+        zeros = filled & ~ones
+        for value, same in ((0, ones), (1, zeros)):
+            pairs = same & (same >> 1)
+            # As posições antes (j - 1) e depois (j + 2) do par em j, j + 1.
+            targets = ((pairs >> 1) | (pairs << 2)) & empty
+            while targets:
+                low = targets & -targets
+                moves.append((low.bit_length() - 1, value))
+                targets ^= low
+        return moves
 
     def two_adjacents_horizontal(self, row_number: int):
         """Devolve ações a executar caso existam dois números
         iguais seguidos adjacentes na mesma linha"""
-        actions = []
-        row = self.get_row(row_number)
-        for j in range(1, len(self.board)):
-            current = self.get_number(row_number, j)
-            previous = self.get_number(row_number, j - 1)
-            before_adjacency = (
-                self.get_number(row_number, j - 2) if j - 2 >= 0 else None
+        return [
+            (row_number, j, number)
+            for j, number in self.two_adjacents(
+                self.row_filled[row_number], self.row_ones[row_number]
             )
-            after_adjacency = (
-                self.get_number(row_number, j + 1) if j + 1 < len(self.board) else None
-            )
-
-            if before_adjacency == 2:
-                if current == previous == 0:
-                    actions.append((row_number, j - 2, 1))
-                elif current == previous == 1:
-                    actions.append((row_number, j - 2, 0))
-            if after_adjacency == 2:
-                if current == previous == 0:
-                    actions.append((row_number, j + 1, 1))
-                elif current == previous == 1:
-                    actions.append((row_number, j + 1, 0))
-
-        return actions
+        ]
 
     def two_adjacents_vertical(self, col_number: int):
         """Devolve ações a executar caso existam dois números
         iguais seguidos adjacentes na mesma coluna"""
-        actions = []
-        row = self.get_col(col_number)
-        for i in range(1, len(self.board)):
-            current = self.get_number(i, col_number)
-            previous = self.get_number(i - 1, col_number)
-            before_adjacency = (
-                self.get_number(i - 2, col_number) if i - 2 >= 0 else None
-            )
-            after_adjacency = (
-                self.get_number(i + 1, col_number) if i + 1 < len(self.board) else None
+        return [
+            (i, col_number, number)
+            for i, number in self.two_adjacents(
+                self.col_filled[col_number], self.col_ones[col_number]
             )
-
-            if before_adjacency == 2:
-                if current == previous == 0:
-                    actions.append((i - 2, col_number, 1))
-                elif current == previous == 1:
-                    actions.append((i - 2, col_number, 0))
-            if after_adjacency == 2:
-                if current == previous == 0:
-                    actions.append((i + 1, col_number, 1))
-                elif current == previous == 1:
-                    actions.append((i + 1, col_number, 0))
-
-        return actions
+        ]
 
     @staticmethod
     def parse_instance_from_stdin():
@@ -266,114 +507,697 @@ class Board:
             > stdin.readline()
         """
 
-        from sys import stdin
-
-        n = int(stdin.readline())
-        board = ()
+        return next(Board.parse_instances(sys.stdin.buffer))
 
-        for i in range(n):
-            row = ()
-            input_row = tuple(map(int, stdin.readline().split()))
-            for j in range(n):
-                row += (input_row[j],)
-            board += (row,)
+    @staticmethod
+    def parse_instances(stream):
+        """Gerador que lê do stream dado (de texto ou binário) várias
+        instâncias seguidas no formato dos testes (N seguido de N linhas)
+        e devolve um Board de cada vez. O stream é lido em blocos (ver
+        read_lines), pelo que a memória usada não depende do tamanho do
+        ficheiro. Linhas vazias e linhas começadas por '#' são ignoradas.
+
+        Levanta ValueError, com o número da instância, se o stream acabar
+        a meio de uma instância ou se uma linha não tiver N números."""
+        lines = (
+            line
+            for line in read_lines(stream)
+            if line.strip() and line.lstrip()[:1] not in ("#", b"#")
+        )
+        for k, header in enumerate(lines, 1):
+            n = int(header)
+            rows = []
+            for i in range(n):
+                line = next(lines, None)
+                if line is None:
+                    raise ValueError(f"instância {k} incompleta: {i} de {n} linhas")
+                row = tuple(map(int, line.split()))
+                if len(row) != n:
+                    raise ValueError(
+                        f"instância {k}: a linha {i + 1} tem {len(row)} números "
+                        f"em vez de {n}"
+                    )
+                rows.append(row)
+            yield Board(tuple(rows))
 
-        return Board(board)
+    @staticmethod
+    def parse_file(path):
+        """Gerador dos tabuleiros do ficheiro dado, lido através de um
+        mmap para evitar cópias intermédias do conteúdo."""
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from Board.parse_instances(mapped)
 
     def check_only_option(self, tup: tuple, is_row: bool, row_or_col_number: int):
         """Devolve uma lista de ações a executar caso seja
         possível prever incoerências na linha ou coluna dadas."""
-        empty_indices = []
-        for i in range(len(tup)):
-            if tup[i] == 2:
-                empty_indices.append(i)
-
-        options = [tup]
-        while options[0].count(2) > 0:
-            option1 = ()
-            option2 = ()
-            for i in range(len(options[0])):
-                if options[0][i] != 2:
-                    option1 += (options[0][i],)
-                else:
-                    option2 = option1 + (1,) + options[0][i + 1 :]
-                    option1 = option1 + (0,) + options[0][i + 1 :]
-                    break
-            options.pop(0)
-            options.append(option1)
-            options.append(option2)
-
-        validOptions = []
-        for option in options:
-            if self.is_valid_count(option) and self.is_valid_adjacent(option):
-                validOptions.append(option)
-
+        filled, ones = self.tuple_to_mask(tup)
+        return self.only_option_actions(filled, ones, is_row, row_or_col_number)
+
+    def only_option_actions(
+        self, filled: int, ones: int, is_row: bool, row_or_col_number: int
+    ):
+        """Devolve as ações forçadas na linha ou coluna dada pelas
+        máscaras, i.e. as posições vazias que têm o mesmo valor em todas
+        as formas válidas de completar a linha ou coluna."""
+        _, forced, forced_ones = line_options(self.n, filled, ones)
         actions = []
-        for i in empty_indices:
-            uniques = set()
-            for j in range(len(validOptions)):
-                uniques.add(validOptions[j][i])
-            if len(uniques) == 1:
-                if is_row:
-                    actions.append((row_or_col_number, i, uniques.pop()))
-                else:
-                    actions.append((i, row_or_col_number, uniques.pop()))
+        while forced:
+            low = forced & -forced
+            i = low.bit_length() - 1
+            number = 1 if forced_ones & low else 0
+            if is_row:
+                actions.append((row_or_col_number, i, number))
+            else:
+                actions.append((i, row_or_col_number, number))
+            forced ^= low
 
         return actions
 
+    def line_masks(self, line: int) -> (int, int):
+        """Devolve as máscaras (preenchidas, uns) da linha ou coluna
+        identificada por line: 0..N-1 são as linhas e N..2N-1 as colunas."""
+        if line < self.n:
+            return self.row_filled[line], self.row_ones[line]
+        return self.col_filled[line - self.n], self.col_ones[line - self.n]
+
+    def is_valid_partial(self, filled: int, ones: int) -> bool:
+        """Devolve True se a linha ou coluna, possivelmente incompleta,
+        não tiver três números iguais seguidos nem mais zeros ou uns do
+        que o permitido."""
+        limit = (self.n + 1) // 2
+        n_ones = ones.bit_count()
+        return (
+            n_ones <= limit
+            and filled.bit_count() - n_ones <= limit
+            and self.is_valid_adjacent_mask(filled, ones)
+        )
+
+    # Cada regra de dedução recebe uma linha ou coluna e as suas máscaras
+    # e devolve as máscaras (forçadas, forçadas a 1) das posições vazias
+    # que consegue deduzir, ou None se encontrar uma contradição.
+
+    def adjacency_rule(self, line: int, filled: int, ones: int):
+        """Regra de adjacência: ao lado de dois números iguais seguidos,
+        ou entre dois números iguais, só pode estar o outro número."""
+        empty = self.full_mask & ~filled
+        zeros = filled & ~ones
+        pairs_ones = ones & (ones >> 1)
+        pairs_zeros = zeros & (zeros >> 1)
+        place_zero = (pairs_ones >> 1) | (pairs_ones << 2) | (ones << 1) & (ones >> 1)
+        place_one = (
+            (pairs_zeros >> 1) | (pairs_zeros << 2) | (zeros << 1) & (zeros >> 1)
+        )
+        place_zero &= empty
+        place_one &= empty
+        if place_zero & place_one:
+            return None
+        return place_zero | place_one, place_one
+
+    def count_rule(self, line: int, filled: int, ones: int):
+        """Regra de contagem: se a linha já tem todos os zeros (ou uns)
+        permitidos, as restantes posições têm o outro número."""
+        limit = (self.n + 1) // 2
+        n_ones = ones.bit_count()
+        n_zeros = filled.bit_count() - n_ones
+        if n_ones > limit or n_zeros > limit:
+            return None
+        empty = self.full_mask & ~filled
+        if n_zeros == limit:
+            return empty, empty
+        if n_ones == limit:
+            return empty, 0
+        return 0, 0
+
+    def only_option_rule(self, line: int, filled: int, ones: int):
+        """Regra da única opção: as posições que têm o mesmo valor em
+        todas as formas válidas de completar a linha (ver line_options)."""
+        completions, forced, forced_ones = line_options(self.n, filled, ones)
+        if not completions:
+            return None
+        return forced, forced_ones
+
+    def uniqueness_rule(self, line: int, filled: int, ones: int):
+        """Regra da unicidade: numa linha com até UNIQUENESS_EMPTIES
+        posições vazias, as completações iguais a uma linha já completa
+        são eliminadas.
+
+        Só as linhas completas compatíveis com as posições preenchidas
+        (s & filled == ones) podem eliminar completações; se não houver
+        nenhuma, as completações nem chegam a ser geradas."""
+        empty = self.full_mask & ~filled
+        k = empty.bit_count()
+        if k > UNIQUENESS_EMPTIES:
+            return 0, 0
+        signatures = self.row_signatures if line < self.n else self.col_signatures
+        if not any(signature & filled == ones for signature in signatures):
+            return 0, 0
+        if k == 2:
+            low = empty & -empty
+            candidates = [
+                candidate
+                for candidate in (ones, ones | low, ones | (empty ^ low), ones | empty)
+                if self.is_valid_partial(self.full_mask, candidate)
+            ]
+        else:
+            candidates = map(int, line_candidates(self.n, filled, ones))
+        valid = [candidate for candidate in candidates if candidate not in signatures]
+        if not valid:
+            return None
+        forced = empty
+        for candidate in valid[1:]:
+            forced &= ~(candidate ^ valid[0])
+        return forced, valid[0] & forced
+
+    def uniqueness_lines(self, first_line: int) -> list:
+        """Devolve as linhas (first_line = 0) ou colunas (first_line = N)
+        a que a regra da unicidade se aplica: as que têm entre duas e
+        UNIQUENESS_EMPTIES posições vazias."""
+        full = self.full_mask
+        return [
+            line
+            for line in range(first_line, first_line + self.n)
+            if 2 <= (full & ~self.line_masks(line)[0]).bit_count() <= UNIQUENESS_EMPTIES
+        ]
+
+    def play(
+        self,
+        row: int,
+        col: int,
+        number: int,
+        rules=None,
+        trail=None,
+        stats=None,
+        reasons=None,
+    ):
+        """Coloca o número na posição dada e propaga as deduções a partir
+        da respetiva linha e coluna (ver propagate), alterando o
+        tabuleiro. Devolve False se a jogada levar a uma contradição."""
+        self.set_number(row, col, number)
+        if trail is not None:
+            trail.append((row, col))
+        if self.duplicate:
+            full = self.full_mask
+            return self.fail(row if self.row_filled[row] == full else self.n + col)
+        lines = [row, self.n + col]
+        if self.row_filled[row] == self.full_mask:
+            lines += self.uniqueness_lines(0)
+        if self.col_filled[col] == self.full_mask:
+            lines += self.uniqueness_lines(self.n)
+        return self.propagate(rules, trail, stats, lines, reasons)
+
+    def fail(self, line: int) -> bool:
+        """Marca o tabuleiro como contraditório por causa da linha (ou
+        coluna) dada e devolve False."""
+        self.contradiction = True
+        self.conflict_line = line
+        return False
+
+    def propagate(
+        self, rules=None, trail=None, stats=None, lines=None, reasons=None
+    ) -> bool:
+        """Aplica as regras de dedução (por omissão, todas as de RULES)
+        às linhas dadas (por omissão, todas as linhas e colunas) e às que
+        forem sendo alteradas, até não haver mais nada a deduzir,
+        alterando o tabuleiro.
+
+        Devolve False (e marca o tabuleiro como contraditório) se alguma
+        linha ou coluna deixar de ter solução. As posições preenchidas são
+        acrescentadas a trail, se for dada. Se for dado stats, cada regra
+        soma em stats[regra] = [chamadas, nanossegundos, posições
+        deduzidas] o seu custo e as posições que deduziu. Se for
+        dado reasons, cada posição deduzida fica associada ao par (linha ou
+        coluna de que foi deduzida, regra que a deduziu) (ver cbj_solve)."""
+        if self.contradiction:
+            return False
+        if self.duplicate:
+            return self.fail(self.duplicate_line())
+        if rules is None:
+            rules = RULES
+        n = self.n
+        full = self.full_mask
+        queue = deque()
+        queued = [False] * (2 * n)
+
+        def enqueue(line):
+            if not queued[line]:
+                queued[line] = True
+                queue.append(line)
+
+        for line in range(2 * n) if lines is None else lines:
+            enqueue(line)
+
+        while queue:
+            line = queue.popleft()
+            queued[line] = False
+            filled, ones = self.line_masks(line)
+            if not self.is_valid_partial(filled, ones):
+                return self.fail(line)
+            if filled == full:
+                continue
+
+            forced = forced_ones = 0
+            # Regra que deduziu primeiro cada posição (para reasons).
+            sources = []
+            for rule in rules:
+                if stats is None:
+                    deduced = RULES[rule](self, line, filled, ones)
+                else:
+                    start = time.perf_counter_ns()
+                    deduced = RULES[rule](self, line, filled, ones)
+                    entry = stats.setdefault(rule, [0, 0, 0])
+                    entry[0] += 1
+                    entry[1] += time.perf_counter_ns() - start
+                    if deduced is not None:
+                        entry[2] += (deduced[0] & ~forced).bit_count()
+                if deduced is None or (forced_ones ^ deduced[1]) & forced & deduced[0]:
+                    return self.fail(line)
+                if reasons is not None and deduced[0] & ~forced:
+                    sources.append((rule, deduced[0] & ~forced))
+                forced |= deduced[0]
+                forced_ones |= deduced[1]
+
+            if not forced:
+                continue
+            # A própria linha volta a ser verificada com os novos valores.
+            enqueue(line)
+            while forced:
+                low = forced & -forced
+                pos = low.bit_length() - 1
+                i, j = (line, pos) if line < n else (pos, line - n)
+                self.set_number(i, j, 1 if forced_ones & low else 0)
+                if trail is not None:
+                    trail.append((i, j))
+                if reasons is not None:
+                    reasons[i, j] = line, next(
+                        rule for rule, mask in sources if mask & low
+                    )
+                if self.duplicate:
+                    return self.fail(i if self.row_filled[i] == full else n + j)
+                enqueue(n + j if line < n else i)
+                if "uniqueness" in rules:
+                    # Uma nova linha (ou coluna) completa pode eliminar
+                    # completações das que têm poucas posições vazias.
+                    if self.row_filled[i] == full:
+                        for other in self.uniqueness_lines(0):
+                            enqueue(other)
+                    if self.col_filled[j] == full:
+                        for other in self.uniqueness_lines(n):
+                            enqueue(other)
+                forced ^= low
+
+        return True
+
+
+# Simetrias do tabuleiro, que preservam as regras: cada uma é um tuplo
+# (transpor, espelhar cada linha, inverter a ordem das linhas, trocar 0 e
+# 1), aplicados por esta ordem. As oito combinações das três primeiras
+# são as rotações e reflexões do quadrado.
+SYMMETRIES = tuple(
+    (transpose, mirror, flip, swap)
+    for transpose in (False, True)
+    for mirror in (False, True)
+    for flip in (False, True)
+    for swap in (False, True)
+)
 
-class Takuzu(Problem):
-    def __init__(self, board: Board):
-        """O construtor especifica o estado inicial."""
 
+def inverse_symmetry(symmetry: tuple) -> tuple:
+    """Devolve a simetria inversa da dada. Espelhar as linhas e depois
+    transpor é o mesmo que transpor e depois inverter a ordem das linhas
+    (e vice-versa), pelo que, com transposição, a inversa troca as duas
+    operações."""
+    transpose, mirror, flip, swap = symmetry
+    if transpose:
+        return transpose, flip, mirror, swap
+    return symmetry
+
+
+@lru_cache(maxsize=None)
+def zobrist_table(n: int) -> tuple:
+    """Devolve a tabela de Zobrist dos tabuleiros N x N: um inteiro
+    aleatório de 64 bits para cada par (posição, número), na posição
+    2 * (linha * N + coluna) + número. O hash de um tabuleiro é o XOR
+    dos valores das posições preenchidas. A semente é fixa para que o
+    hash seja o mesmo em todos os processos."""
+    generator = random.Random(n)
+    return tuple(generator.getrandbits(64) for _ in range(2 * n * n))
+
+
+# Tamanho dos blocos lidos de cada vez por read_lines.
+READ_CHUNK_SIZE = 1 << 16
+
+
+def read_lines(stream, chunk_size=READ_CHUNK_SIZE):
+    """Gerador das linhas de um stream (ficheiro de texto ou binário, ou
+    mmap), lido em blocos de chunk_size em vez de linha a linha."""
+    tail = None
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if tail:
+            chunk = tail + chunk
+        lines = chunk.split(b"\n" if isinstance(chunk, bytes) else "\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+# Número máximo de padrões de linha guardados na cache de line_options.
+LINE_CACHE_SIZE = 1 << 16
+
+# Dimensão máxima com que line_options consulta a tabela de linhas válidas
+# de patterns.py, para linhas com menos de metade das posições
+# preenchidas. Nas linhas mais preenchidas, e nas dimensões maiores (em
+# que a tabela tem milhões de linhas), explorar as completações é mais
+# rápido.
+STORE_LOOKUP_SIZE = 24
+
+# Número máximo de posições vazias das linhas a que a regra da unicidade
+# se aplica (ver Board.uniqueness_rule): com k posições vazias há no
+# máximo C(k, k/2) completações a comparar com as linhas completas.
+UNIQUENESS_EMPTIES = 6
+
+
+@lru_cache(maxsize=LINE_CACHE_SIZE)
+def line_options(n: int, filled: int, ones: int) -> (int, int, int):
+    """Analisa as formas válidas de completar uma linha ou coluna de
+    dimensão n dada pelas máscaras (preenchidas, uns).
+
+    Devolve um tuplo (completions, forced, forced_ones) com o número de
+    completações válidas, a máscara das posições vazias que têm o mesmo
+    valor em todas elas e, dessas, a máscara das que têm 1. Se não existir
+    nenhuma completação válida, completions é 0 e nada é forçado.
+
+    As completações são exploradas em profundidade sobre o estado
+    (posição, zeros, uns, último valor, repetições do último valor),
+    cortando logo os prefixos com três iguais seguidos ou com mais do que
+    ceil(n / 2) zeros ou uns, e memorizando cada estado; nas linhas
+    esparsas de dimensão até STORE_LOOKUP_SIZE, é consultada a tabela de
+    linhas válidas (ver patterns.PatternStore). O resultado é guardado
+    numa cache LRU partilhada por todos os tabuleiros."""
+    if n <= STORE_LOOKUP_SIZE and 2 * filled.bit_count() < n:
+        return pattern_store(n).options(filled, ones)
+    limit = (n + 1) // 2
+    memo = {}
+
+    def explore(pos, zeros, n_ones, last, run):
+        """Devolve (completações, máscara onde 0 é possível, máscara
+        onde 1 é possível) para as posições a partir de pos."""
+        if pos == n:
+            return 1, 0, 0
+        key = (pos, zeros, n_ones, last, run)
+        if key in memo:
+            return memo[key]
+
+        bit = 1 << pos
+        values = ((ones >> pos) & 1,) if filled & bit else (0, 1)
+        total = can_zero = can_one = 0
+        for value in values:
+            new_run = run + 1 if value == last else 1
+            new_zeros = zeros + 1 - value
+            new_ones = n_ones + value
+            if new_run > 2 or new_zeros > limit or new_ones > limit:
+                continue
+            count, zero_mask, one_mask = explore(
+                pos + 1, new_zeros, new_ones, value, new_run
+            )
+            if count:
+                total += count
+                can_zero |= zero_mask
+                can_one |= one_mask
+                if value:
+                    can_one |= bit
+                else:
+                    can_zero |= bit
+
+        memo[key] = (total, can_zero, can_one)
+        return memo[key]
+
+    completions, can_zero, can_one = explore(0, 0, 0, 2, 0)
+    if not completions:
+        return 0, 0, 0
+    empty = ((1 << n) - 1) & ~filled
+    forced = (can_zero ^ can_one) & empty
+    return completions, forced, can_one & forced
+
+
+def are_valid_arrays(arrays) -> np.ndarray:
+    """Valida de uma só vez uma pilha de tabuleiros, dada como array
+    B x N x N de int8 com 2 nas posições vazias (N < 64). Devolve um
+    array de B booleanos, True para os tabuleiros que cumprem:
+    - linhas e colunas completas diferentes entre si
+    - no máximo ceil(N / 2) zeros e ceil(N / 2) uns por linha e coluna
+    - restrições de adjacência"""
+    arrays = np.asarray(arrays, dtype=np.int8)
+    n = arrays.shape[-1]
+    # Linhas seguidas das colunas: B x 2N x N.
+    lines = np.concatenate((arrays, arrays.transpose(0, 2, 1)), axis=1)
+    filled = lines != 2
+
+    triples = (
+        (lines[:, :, :-2] == lines[:, :, 1:-1])
+        & (lines[:, :, 1:-1] == lines[:, :, 2:])
+        & filled[:, :, 2:]
+    )
+    valid = ~triples.any(axis=(1, 2))
+
+    limit = (n + 1) // 2
+    ones = (lines == 1).sum(axis=2)
+    zeros = (lines == 0).sum(axis=2)
+    valid &= ((ones <= limit) & (zeros <= limit)).all(axis=1)
+
+    # Cada linha completa é empacotada num inteiro; as incompletas recebem
+    # valores distintos acima de 2^N, para nunca serem iguais a outras.
+    weights = np.uint64(1) << np.arange(n, dtype=np.uint64)
+    packed = (lines == 1).astype(np.uint64) @ weights
+    incomplete = (np.uint64(1) << np.uint64(n)) + np.arange(2 * n, dtype=np.uint64)
+    packed = np.where(filled.all(axis=2), packed, incomplete)
+    packed = np.sort(packed.reshape(-1, 2, n), axis=2)
+    valid &= ~(packed[:, :, 1:] == packed[:, :, :-1]).any(axis=(1, 2))
+
+    return valid
+
+
+def is_valid_array(array) -> bool:
+    """Valida um tabuleiro N x N de int8 (ver are_valid_arrays)."""
+    return bool(are_valid_arrays(np.asarray(array)[None])[0])
+
+
+def are_solved_arrays(arrays) -> np.ndarray:
+    """Devolve um array de booleanos, True para os tabuleiros da pilha
+    B x N x N que estão completos e são válidos."""
+    arrays = np.asarray(arrays, dtype=np.int8)
+    return are_valid_arrays(arrays) & (arrays != 2).all(axis=(1, 2))
+
+
+def is_solution(board: Board, solution: Board) -> bool:
+    """Devolve True se a solução for uma solução do tabuleiro: completa,
+    válida e com os números dados do tabuleiro."""
+    given = board.to_array()
+    array = solution.to_array()
+    return (
+        len(solution) == len(board)
+        and bool(are_solved_arrays(array[None])[0])
+        and bool(((given == 2) | (given == array)).all())
+    )
+
+
+# Regras de dedução aplicadas por Board.propagate, pela ordem de aplicação.
+RULES = {
+    "adjacency": Board.adjacency_rule,
+    "count": Board.count_rule,
+    "only_option": Board.only_option_rule,
+    "uniqueness": Board.uniqueness_rule,
+}
+
+
+# Políticas de ramificação: cada uma recebe um tabuleiro com posições
+# vazias (e já sem deduções por fazer) e os pesos de conflito das linhas
+# e colunas, e devolve a posição onde ramificar e os dois números pela
+# ordem em que devem ser experimentados.
+
+
+def preferred_values(board: Board, row: int, col: int) -> tuple:
+    """Ordena os números a experimentar na posição dada: primeiro o que
+    tem mais espaço livre (limite menos ocorrências) na linha e coluna."""
+    limit = (board.n + 1) // 2
+    ones = board.row_ones[row].bit_count() + board.col_ones[col].bit_count()
+    filled = board.row_filled[row].bit_count() + board.col_filled[col].bit_count()
+    zero_room = 2 * limit - (filled - ones)
+    one_room = 2 * limit - ones
+    return (0, 1) if zero_room >= one_room else (1, 0)
+
+
+def empty_cells(board: Board):
+    """Gerador das posições vazias do tabuleiro, por linhas."""
+    for i in range(board.n):
+        empty = board.full_mask & ~board.row_filled[i]
+        while empty:
+            low = empty & -empty
+            yield i, low.bit_length() - 1
+            empty ^= low
+
+
+def first_empty_policy(board: Board, weights: list):
+    """Primeira posição vazia, por linhas, experimentando 0 e depois 1."""
+    i = next(i for i in range(board.n) if board.row_filled[i] != board.full_mask)
+    return i, board.first_empty(board.row_filled[i]), (0, 1)
+
+
+def most_constrained_policy(board: Board, weights: list):
+    """Posição vazia cuja linha e coluna têm, em conjunto, menos posições
+    vazias."""
+    full = board.full_mask
+    row_empties = [(full & ~filled).bit_count() for filled in board.row_filled]
+    col_empties = [(full & ~filled).bit_count() for filled in board.col_filled]
+    i, j = min(empty_cells(board), key=lambda c: row_empties[c[0]] + col_empties[c[1]])
+    return i, j, preferred_values(board, i, j)
+
+
+def fewest_completions_policy(board: Board, weights: list):
+    """Posição vazia da linha ou coluna com menos completações válidas
+    (ver line_options); dentro dela, a posição cuja linha ou coluna
+    perpendicular também tem menos completações."""
+    n = board.n
+    full = board.full_mask
+    completions = [
+        (
+            line_options(n, *board.line_masks(line))[0]
+            if board.line_masks(line)[0] != full
+            else None
+        )
+        for line in range(2 * n)
+    ]
+    line = min(
+        (line for line in range(2 * n) if completions[line] is not None),
+        key=completions.__getitem__,
+    )
+    empty = full & ~board.line_masks(line)[0]
+    positions = [pos for pos in range(n) if (empty >> pos) & 1]
+    if line < n:
+        i, j = line, min(positions, key=lambda pos: completions[n + pos])
+    else:
+        i, j = min(positions, key=completions.__getitem__), line - n
+    return i, j, preferred_values(board, i, j)
+
+
+def conflict_weighted_policy(board: Board, weights: list):
+    """Estilo dom/wdeg: posição vazia cuja linha e coluna somam mais
+    conflitos (pesos incrementados sempre que a propagação falha numa
+    linha ou coluna), desempatando pela que tem menos posições vazias."""
+    n = board.n
+    full = board.full_mask
+    row_empties = [(full & ~filled).bit_count() for filled in board.row_filled]
+    col_empties = [(full & ~filled).bit_count() for filled in board.col_filled]
+    i, j = min(
+        empty_cells(board),
+        key=lambda c: (
+            -(weights[c[0]] + weights[n + c[1]]),
+            row_empties[c[0]] + col_empties[c[1]],
+        ),
+    )
+    return i, j, preferred_values(board, i, j)
+
+
+# Políticas de ramificação disponíveis (ver Takuzu.actions e trail_solve).
+BRANCHING_POLICIES = {
+    "first": first_empty_policy,
+    "constrained": most_constrained_policy,
+    "completions": fewest_completions_policy,
+    "wdeg": conflict_weighted_policy,
+}
+
+
+# Heurísticas das procuras informadas (ver Takuzu.h): cada uma recebe um
+# tabuleiro sem contradições (e já sem deduções por fazer) e estima o
+# trabalho que falta para o resolver; os tabuleiros com menor estimativa
+# são expandidos primeiro.
+
+# Desempate a favor dos nós mais profundos (ver Takuzu.h): é menor do que
+# o arredondamento das heurísticas a milésimas, mesmo com N² decisões.
+TIE_BREAK = 1e-7
+
+
+def empties_heuristic(board: Board) -> float:
+    """Número de posições vazias."""
+    return board.empties
+
+
+def completions_heuristic(board: Board) -> float:
+    """Bits que faltam decidir: a soma, pelas linhas e colunas
+    incompletas, do logaritmo (base 2) do número de completações válidas
+    (ver line_options). É 0 se cada linha e coluna só puder ser
+    completada de uma forma."""
+    n = board.n
+    full = board.full_mask
+    bits = 0.0
+    for line in range(2 * n):
+        filled, ones = board.line_masks(line)
+        if filled != full:
+            bits += math.log2(line_options(n, filled, ones)[0])
+    return bits
+
+
+# Heurísticas disponíveis (ver Takuzu.h).
+HEURISTICS = {
+    "empties": empties_heuristic,
+    "completions": completions_heuristic,
+}
+
+
+class Takuzu(Problem):
+    def __init__(
+        self, board: Board, policy="completions", heuristic="empties", propagate=True
+    ):
+        """O construtor especifica o estado inicial, já com todas as
+        deduções possíveis aplicadas, a política de ramificação (ver
+        BRANCHING_POLICIES) e a heurística das procuras informadas (ver
+        HEURISTICS). Com propagate=False, o tabuleiro dado já tem as
+        deduções aplicadas e é usado sem ser copiado."""
+        if propagate:
+            board = board.copy()
+            board.propagate()
         self.initial = TakuzuState(board)
+        self.policy = BRANCHING_POLICIES[policy]
+        self.heuristic = HEURISTICS[heuristic]
+        # Estatísticas por regra de dedução e da política de ramificação
+        # (ver Board.propagate), preenchidas se InstrumentedProblem as
+        # pedir com profile=True.
+        self.counters = None
+        # Número de contradições encontradas em cada linha e coluna.
+        self.weights = [0] * (2 * len(board))
+        self.nodes_expanded = 0
 
     def actions(self, state: TakuzuState):
         """Retorna uma lista de ações que podem ser executadas a
-        partir do estado passado como argumento."""
-        actions = []
-        for i in range(len(state.board)):
-            for j in range(len(state.board)):
-                if state.board.get_number(i, j) == 2:
-                    number_to_place = state.board.check_equal_adjacent(i, j)
-                    if number_to_place != 2:
-                        return [(i, j, number_to_place)]
-
-        for i in range(len(state.board)):
-            number_to_place = state.board.check_counter_row(i)
-            if number_to_place != 2:
-                for j in range(len(state.board)):
-                    if state.board.get_number(i, j) == 2:
-                        return [(i, j, number_to_place)]
-
-        for j in range(len(state.board)):
-            number_to_place = state.board.check_counter_col(j)
-            if number_to_place != 2:
-                for i in range(len(state.board)):
-                    if state.board.get_number(i, j) == 2:
-                        return [(i, j, number_to_place)]
-
-        for i in range(len(state.board)):
-            actions += state.board.two_adjacents_horizontal(i)
-            actions += state.board.two_adjacents_vertical(i)
-
-        if actions == []:
-            for i in range(len(state.board)):
-                actions += state.board.check_only_option(
-                    state.board.get_row(i), True, i
-                )
-                actions += state.board.check_only_option(
-                    state.board.get_col(i), False, i
-                )
-
-        if actions == []:
-            for i in range(len(state.board)):
-                for j in range(len(state.board)):
-                    if state.board.get_number(i, j) == 2:
-                        actions.append((i, j, 0))
-                        actions.append((i, j, 1))
-
-        return list(set(actions))
+        partir do estado passado como argumento.
+
+        Como cada estado já tem todas as deduções aplicadas (ver
+        Board.propagate), as ações são apenas as ramificações: os dois
+        números possíveis na posição escolhida pela política de
+        ramificação. O número a experimentar primeiro fica em último
+        lugar, porque é o primeiro a sair da pilha de
+        depth_first_tree_search."""
+        self.nodes_expanded += 1
+        board = state.board
+        if board.contradiction or not board.empties:
+            return []
+
+        if self.counters is None:
+            i, j, values = self.policy(board, self.weights)
+        else:
+            start = time.perf_counter_ns()
+            i, j, values = self.policy(board, self.weights)
+            entry = self.counters.setdefault("policy", [0, 0, 0])
+            entry[0] += 1
+            entry[1] += time.perf_counter_ns() - start
+            entry[2] += 2
+        return [(i, j, values[1]), (i, j, values[0])]
 
     @staticmethod
     def is_valid_state(state: TakuzuState) -> bool:
@@ -382,58 +1206,745 @@ class Takuzu(Problem):
         - número de zeros e uns válidos
         - restrições de adjacência"""
 
-        rows = state.board.get_rows()
-        cols = state.board.get_cols()
-
-        if not state.board.all_diff(rows) or not state.board.all_diff(cols):
-            return False
-
-        for row in rows:
-            if not state.board.is_valid_count(row):
-                return False
-        for col in cols:
-            if not state.board.is_valid_count(col):
-                return False
-
-        for i in range(len(state.board)):
-            for j in range(len(state.board)):
-                if not state.board.is_valid_adjacents():
-                    return False
-
-        return True
+        return is_valid_array(state.board.to_array())
 
     def result(self, state: TakuzuState, action):
         """Retorna o estado resultante de executar a 'action' sobre
         'state' passado como argumento. A ação a executar deve ser uma
         das presentes na lista obtida pela execução de
-        self.actions(state)."""
-        return TakuzuState(state.board.move_result(action[0], action[1], action[2]))
+        self.actions(state). As deduções que a jogada permite são
+        aplicadas de imediato ao novo tabuleiro."""
+        board = state.board.copy()
+        if not board.play(*action, stats=self.counters):
+            self.weights[board.conflict_line] += 1
+        return TakuzuState(board)
 
     def goal_test(self, state: TakuzuState):
         """Retorna True se e só se o estado passado como argumento é
         um estado objetivo. Deve verificar se todas as posições do tabuleiro
         estão preenchidas com uma sequência de números adjacentes."""
 
-        for i in range(len(state.board)):
-            for j in range(len(state.board)):
-                if state.board.get_number(i, j) == 2:
-                    return False
-
-        rows = state.board.get_rows()
-        cols = state.board.get_cols()
-
-        if not state.board.all_diff(rows) or not state.board.all_diff(cols):
-            return False
-
-        return True
+        board = state.board
+        return board.empties == 0 and not board.duplicate and not board.contradiction
 
     def h(self, node: Node):
-        """Função heuristica utilizada para a procura A*."""
-        empty_spaces = 0
-        for row in node.state.board.get_rows():
-            empty_spaces += row.count(2)
+        """Função heuristica utilizada para a procura A*.
+
+        Devolve a estimativa da heurística escolhida (ver HEURISTICS),
+        arredondada a milésimas, ou infinito se o tabuleiro tiver uma
+        contradição. Os empates são desfeitos a favor dos nós mais
+        profundos, subtraindo TIE_BREAK por cada decisão: tanto em
+        greedy_search como em astar_search (em que o custo de cada ação
+        é 1), o nó com mais decisões de entre os de igual valor está mais
+        perto de uma folha, que é uma solução ou uma contradição."""
+        board = node.state.board
+        if board.contradiction:
+            return math.inf
+        return round(self.heuristic(board), 3) - TIE_BREAK * node.depth
+
+
+def tree_solve(board: Board, policy="completions"):
+    """Resolve o tabuleiro com depth_first_tree_search sobre o problema
+    Takuzu. Devolve o par (tabuleiro resolvido ou None, nós expandidos)."""
+    problem = Takuzu(board, policy)
+    goal_node = depth_first_tree_search(problem)
+    return goal_node.state.board if goal_node else None, problem.nodes_expanded
+
+
+def trail_solve(board: Board, policy="completions"):
+    """Procura em profundidade iterativa sobre um único tabuleiro
+    mutável. Cada decisão coloca um número numa posição vazia e propaga
+    as deduções; as posições preenchidas ficam registadas num trilho
+    (trail) e, ao recuar, são apagadas do tabuleiro em vez de se copiar o
+    tabuleiro. A pilha guarda apenas, por decisão, o comprimento do
+    trilho e o valor alternativo, pelo que a memória usada é O(N² +
+    profundidade). As decisões seguem a política de ramificação dada (ver
+    BRANCHING_POLICIES). Devolve o par (tabuleiro resolvido ou None, nós
+    expandidos)."""
+    choose = BRANCHING_POLICIES[policy]
+    weights = [0] * (2 * len(board))
+    board = board.copy()
+    trail = []
+    if not board.propagate(trail=trail):
+        return None, 0
+
+    # Pilha de decisões por explorar: (comprimento do trilho, linha,
+    # coluna, valor alternativo).
+    stack = []
+    nodes = 0
+    while board.empties:
+        nodes += 1
+        i, j, values = choose(board, weights)
+        stack.append((len(trail), i, j, values[1]))
+        consistent = board.play(i, j, values[0], trail=trail)
+        while not consistent:
+            weights[board.conflict_line] += 1
+            if not stack:
+                return None, nodes
+            length, i, j, number = stack.pop()
+            board.undo(trail, length)
+            consistent = board.play(i, j, number, trail=trail)
+
+    return board, nodes
+
+
+# Número máximo de decisões de um nogood aprendido por cbj_solve: os
+# nogoods maiores raramente voltam a podar e tornam a propagação mais
+# lenta.
+NOGOOD_SIZE = 12
+
+
+def cbj_solve(board: Board, policy="completions"):
+    """Procura em profundidade com retrocesso dirigido por conflitos
+    (conflict-directed backjumping) e aprendizagem de nogoods, sobre um
+    único tabuleiro mutável com trilho de desfazer (como trail_solve).
+
+    Cada posição preenchida tem uma causa: nenhuma, se for uma decisão;
+    as posições que implicam a dedução na linha ou coluna e com a regra
+    registadas por Board.propagate (ver line_reason); ou as restantes
+    posições do nogood que a forçou. Ao ser preenchida, cada posição
+    recebe o conjunto (máscara de bits) das decisões de que depende, que
+    é a união dos das posições da sua causa. Numa contradição, a união
+    dos conjuntos das posições em conflito, com os respetivos valores, é
+    um nogood: não pode ser todo verdadeiro em nenhuma solução. As
+    decisões mais recentes que não fazem parte dele não contribuíram
+    para a contradição e são desfeitas sem experimentar o valor
+    alternativo (backjump). Quando os dois valores de uma decisão falham,
+    os dois nogoods juntam-se, sem essa decisão, e o retrocesso continua
+    a partir do resultado.
+
+    Os nogoods com até NOGOOD_SIZE decisões são guardados e vigiados por
+    dois literais (como as cláusulas de sat.py): quando todos menos um
+    ficam verdadeiros, o último é forçado ao valor oposto, o que corta
+    subárvores equivalentes noutros ramos da procura. Devolve o par
+    (tabuleiro resolvido ou None, nós expandidos)."""
+    choose = BRANCHING_POLICIES[policy]
+    n = len(board)
+    full = board.full_mask
+    limit = (n + 1) // 2
+    weights = [0] * (2 * n)
+    board = board.copy()
+    trail = []
+    if not board.propagate(trail=trail):
+        return None, 0
+    # Posição no trilho e decisões de que depende cada posição (i * N +
+    # j) preenchida. As posições preenchidas antes da primeira decisão
+    # são factos, que ficam com a posição -1 e sem decisões.
+    order = [-1] * (n * n)
+    depends = [0] * (n * n)
+    # Causa de cada posição (linha, coluna) preenchida depois dos factos.
+    reasons = {}
+    # Nogoods como listas de literais 2 * posição + valor, com os
+    # literais vigiados nas duas primeiras posições, e listas de nogoods
+    # vigiados por cada literal.
+    watches = defaultdict(list)
+    head = len(trail)
+    # Posições de cada linha e coluna.
+    line_cells = [[i * n + k for k in range(n)] for i in range(n)] + [
+        [k * n + j for k in range(n)] for j in range(n)
+    ]
+
+    def number(cell: int) -> int:
+        return board.get_number(cell // n, cell % n)
+
+    def line_reason(line: int, before: int, rule=None, pos=None) -> list:
+        """Posições que implicam a dedução da posição pos da linha ou
+        coluna dada pela regra rule ou, sem regra, a contradição nessa
+        linha, considerando só as posições preenchidas antes da posição
+        before do trilho:
+        - adjacência: os dois números iguais ao lado ou à volta de pos
+        - contagem: as posições com o número que atingiu o limite
+        - contradição: três números iguais seguidos ou os números a mais,
+          se os houver
+        - única opção: as posições preenchidas que continuam a forçar o
+          valor de pos, retirando primeiro as mais recentes
+        - nos restantes casos, todas as posições preenchidas e, se a
+          regra da unicidade se aplicar, as das linhas paralelas
+          completas antes de before e compatíveis com elas."""
+        cells = line_cells[line]
+        filled, ones = board.line_masks(line)
+        value = ones >> pos & 1 if pos is not None else None
+        for k, cell in enumerate(cells):
+            if order[cell] >= before:
+                filled &= ~(1 << k)
+        ones &= filled
+        zeros = filled & ~ones
+
+        def at(mask):
+            return [cells[k] for k in range(n) if mask >> k & 1]
+
+        if rule == "adjacency":
+            # O número deduzido é o oposto dos dois que a justificam.
+            other = zeros if value else ones
+            for a, b in ((pos - 1, pos - 2), (pos + 1, pos + 2), (pos - 1, pos + 1)):
+                if 0 <= min(a, b) and other >> a & other >> b & 1:
+                    return [cells[a], cells[b]]
+        if rule == "count":
+            return at(zeros if value else ones)
+        if rule is None:
+            for same in (ones, zeros):
+                triples = same & (same >> 1) & (same >> 2)
+                if triples:
+                    return at((triples & -triples) * 7)
+                if same.bit_count() > limit:
+                    return at(same)[: limit + 1]
+        if rule == "only_option":
+            # As posições preenchidas mais recentes são retiradas enquanto
+            # a posição continuar forçada ao mesmo valor.
+            bit = 1 << pos
+            for k in sorted(range(n), key=lambda k: -order[cells[k]]):
+                if not filled >> k & 1:
+                    continue
+                reduced = filled & ~(1 << k)
+                _, forced, forced_ones = line_options(n, reduced, ones & reduced)
+                if forced & bit and (forced_ones >> pos & 1) == value:
+                    filled = reduced
+            return at(filled)
+        if (full & ~filled).bit_count() > UNIQUENESS_EMPTIES:
+            return at(filled)
+        result = at(filled)
+        first = 0 if line < n else n
+        for other in range(first, first + n):
+            other_filled, other_ones = board.line_masks(other)
+            if other == line or other_filled != full or other_ones & filled != ones:
+                continue
+            if max(order[cell] for cell in line_cells[other]) < before:
+                result += line_cells[other]
+        return result
+
+    def record(start: int):
+        """Regista a posição no trilho e as decisões de que dependem as
+        posições preenchidas a partir da posição start do trilho."""
+        for k in range(start, len(trail)):
+            i, j = trail[k]
+            order[i * n + j] = k
+        for k in range(start, len(trail)):
+            i, j = trail[k]
+            cell = i * n + j
+            reason = reasons[i, j]
+            if reason is None:
+                depends[cell] = 1 << cell
+                continue
+            if isinstance(reason, tuple):
+                line, rule = reason
+                pos = i if line >= n else j
+                reason = line_reason(line, k, rule, pos)
+            mask = 0
+            for other in reason:
+                mask |= depends[other]
+            depends[cell] = mask
+
+    def explain(cells) -> dict:
+        """Devolve o nogood (posição -> valor) das decisões de que
+        dependem as posições dadas."""
+        mask = 0
+        for cell in cells:
+            mask |= depends[cell]
+        conflict = {}
+        while mask:
+            low = mask & -mask
+            cell = low.bit_length() - 1
+            conflict[cell] = number(cell)
+            mask ^= low
+        return conflict
+
+    def learn(conflict: dict):
+        """Guarda o nogood, vigiando as duas decisões mais recentes."""
+        if not 2 <= len(conflict) <= NOGOOD_SIZE:
+            return
+        cells = sorted(conflict, key=order.__getitem__, reverse=True)
+        nogood = [2 * cell + conflict[cell] for cell in cells]
+        watches[nogood[0]].append(nogood)
+        watches[nogood[1]].append(nogood)
+
+    def assign(cell: int, value: int, reason):
+        """Coloca o valor na posição dada e propaga as deduções do
+        tabuleiro e dos nogoods. Devolve None, ou as posições em conflito
+        se houver uma contradição."""
+        nonlocal head
+        forced = [(cell, value, reason)]
+        while forced:
+            cell, value, reason = forced.pop()
+            current = number(cell)
+            if current != 2:
+                if current != value:
+                    return [cell, *reason]
+                continue
+            start = len(trail)
+            reasons[divmod(cell, n)] = reason
+            consistent = board.play(
+                cell // n, cell % n, value, trail=trail, reasons=reasons
+            )
+            record(start)
+            if not consistent:
+                weights[board.conflict_line] += 1
+                return line_reason(board.conflict_line, len(trail))
+            while head < len(trail):
+                i, j = trail[head]
+                head += 1
+                true_literal = 2 * (i * n + j) + board.get_number(i, j)
+                watchers = watches[true_literal]
+                kept = []
+                k = 0
+                while k < len(watchers):
+                    nogood = watchers[k]
+                    k += 1
+                    if nogood[0] == true_literal:
+                        nogood[0], nogood[1] = nogood[1], nogood[0]
+                    other = number(nogood[0] >> 1)
+                    if other == 1 - (nogood[0] & 1):
+                        kept.append(nogood)
+                        continue
+                    for m in range(2, len(nogood)):
+                        literal = nogood[m]
+                        if number(literal >> 1) != literal & 1:
+                            nogood[1], nogood[m] = literal, nogood[1]
+                            watches[literal].append(nogood)
+                            break
+                    else:
+                        kept.append(nogood)
+                        cells = [literal >> 1 for literal in nogood]
+                        if other != 2:
+                            kept += watchers[k:]
+                            watches[true_literal] = kept
+                            return cells
+                        forced.append((cells[0], 1 - (nogood[0] & 1), cells[1:]))
+                watches[true_literal] = kept
+        return None
+
+    def backjump(conflict: dict) -> bool:
+        """Retrocede a partir do nogood dado até à decisão mais recente
+        que dele faz parte e experimenta o valor alternativo dessa
+        decisão. Devolve False se a procura se esgotar."""
+        nonlocal head
+        while stack:
+            length, cell, alternative, previous = stack.pop()
+            board.undo(trail, length)
+            head = min(head, length)
+            if cell not in conflict:
+                continue
+            del conflict[cell]
+            if alternative is None:
+                conflict.update(previous)
+                learn(conflict)
+                continue
+            stack.append((length, cell, None, conflict))
+            cells = assign(cell, alternative, None)
+            if cells is None:
+                return True
+            conflict = explain(cells)
+            learn(conflict)
+        return False
+
+    # Pilha de decisões: (comprimento do trilho, posição, valor
+    # alternativo, ou None se já for o valor alternativo, e nesse caso o
+    # nogood do primeiro valor).
+    stack = []
+    nodes = 0
+    while board.empties:
+        nodes += 1
+        i, j, values = choose(board, weights)
+        stack.append((len(trail), i * n + j, values[1], None))
+        cells = assign(i * n + j, values[0], None)
+        if cells is not None:
+            conflict = explain(cells)
+            learn(conflict)
+            if not backjump(conflict):
+                return None, nodes
+
+    if board.duplicate:
+        return None, nodes
+    return board, nodes
+
+
+def cdcl_solve(board: Board, policy="completions"):
+    """Resolve o tabuleiro codificando-o em CNF e usando o solver CDCL de
+    sat.py (a política de ramificação não se aplica: as decisões seguem a
+    atividade das variáveis). Devolve o par (tabuleiro resolvido ou None,
+    decisões do solver)."""
+    from sat import sat_solve
+
+    return sat_solve(board)
+
+
+def rows_solve(board: Board, policy="completions"):
+    """Procura que escolhe linhas ou colunas completas em vez de posições,
+    sobre as linhas válidas de cada dimensão (ver patterns.py).
+
+    Em cada nó é completada a linha ou coluna com menos completações
+    válidas, contadas pela cache de line_options, e só para essa são
+    obtidas da tabela as linhas válidas compatíveis com as posições
+    preenchidas: as suas posições vazias são jogadas no tabuleiro, com
+    propagação das deduções (que validam as linhas e colunas cruzadas e
+    fixam posições das restantes), e desfeitas pelo trilho ao recuar. As
+    linhas e colunas repetidas são detetadas pelas assinaturas do
+    tabuleiro. A política de ramificação não se aplica.
+
+    Acima de MAX_PATTERN_SIZE não há tabela e as linhas teriam de ser
+    enumeradas em Python; a escolha de linhas completas também recua
+    mal nesses tabuleiros (um 40x40 esparso pode exigir milhares de
+    linhas), pelo que é usada trail_solve, com um aviso no stderr.
+    Devolve o par (tabuleiro resolvido ou None, linhas ou colunas
+    escolhidas, ou nós de trail_solve)."""
+    if len(board) > MAX_PATTERN_SIZE:
+        print(
+            f"rows: sem tabela de linhas para N = {len(board)} > "
+            f"{MAX_PATTERN_SIZE}; a usar trail",
+            file=sys.stderr,
+        )
+        return trail_solve(board, policy)
+    board = board.copy()
+    trail = []
+    if not board.propagate(trail=trail):
+        return None, 0
+    n = board.n
+    full = board.full_mask
+    nodes = 0
+
+    def place(line, pattern):
+        """Joga as posições vazias da linha ou coluna com os valores de
+        pattern. Devolve False se encontrar uma contradição."""
+        filled, _ = board.line_masks(line)
+        empty = full & ~filled
+        while empty:
+            k = (empty & -empty).bit_length() - 1
+            i, j = (line, k) if line < n else (k, line - n)
+            if board.get_number(i, j) == 2:
+                if not board.play(i, j, pattern >> k & 1, trail=trail):
+                    return False
+            empty &= empty - 1
+        return True
 
-        return empty_spaces
+    def search():
+        """Completa o tabuleiro, escolhendo em cada nó a linha ou coluna
+        incompleta com menos completações."""
+        nonlocal nodes
+        if not board.empties:
+            return not board.duplicate
+        best = best_count = None
+        for line in range(2 * n):
+            filled, ones = board.line_masks(line)
+            if filled == full:
+                continue
+            count = line_options(n, filled, ones)[0]
+            if not count:
+                return False
+            if best is None or count < best_count:
+                best, best_count = line, count
+
+        filled, ones = board.line_masks(best)
+        for pattern in line_candidates(n, filled, ones).tolist():
+            nodes += 1
+            length = len(trail)
+            if place(best, pattern) and search():
+                return True
+            board.undo(trail, length)
+        return False
+
+    if not search():
+        return None, nodes
+    return board, nodes
+
+
+# Procuras disponíveis para resolver um tabuleiro (ver solve).
+SOLVERS = {
+    "tree": tree_solve,
+    "trail": trail_solve,
+    "cbj": cbj_solve,
+    "sat": cdcl_solve,
+    "rows": rows_solve,
+}
+
+
+def solve(board: Board, solver="tree", policy="completions"):
+    """Resolve o tabuleiro com o método e a política de ramificação dados
+    (ver SOLVERS e BRANCHING_POLICIES). Devolve o par (tabuleiro resolvido
+    ou None se não tiver solução, nós expandidos)."""
+    return SOLVERS[solver](board, policy)
+
+
+def cached_solve(board: Board, cache: ResultCache, solver="tree", policy="completions"):
+    """Resolve o tabuleiro como solve, consultando primeiro a cache de
+    resultados. A chave é a forma canónica do tabuleiro (ver
+    Board.canonical_form) e o valor a solução da forma canónica, pelo que
+    um tabuleiro igual a outro já resolvido a menos de uma simetria é
+    respondido transformando de volta a solução guardada. Devolve o par
+    (tabuleiro resolvido ou None, nós expandidos), com None em vez dos nós
+    se a solução vier da cache."""
+    key, symmetry = board.canonical_form()
+    key = f"{len(board)}:" + ",".join(f"{code:x}" for code in key)
+    cached = cache.get(key)
+    if cached is not None:
+        canonical = Board(
+            tuple(tuple(map(int, line.split("\t"))) for line in cached.splitlines())
+        )
+        return canonical.transformed(symmetry, inverse=True), None
+    solution, nodes = solve(board, solver, policy)
+    if solution is not None:
+        cache.put(key, str(solution.transformed(symmetry)))
+    return solution, nodes
+
+
+def count_solutions(board: Board, limit=None, policy="completions", max_nodes=None):
+    """Conta as soluções do tabuleiro, parando assim que a contagem
+    atingir limit (se dado; por exemplo, 2 para verificar se a solução é
+    única). Devolve o par (número de soluções, ou limit se houver pelo
+    menos limit, nós expandidos). Se max_nodes for dado e a procura
+    precisar de mais nós, desiste e o número de soluções é None.
+
+    A procura é a de trail_solve, mas explora os dois valores de cada
+    posição escolhida: como cada ramificação divide as soluções em dois
+    conjuntos disjuntos, nenhuma é contada duas vezes. O número de
+    soluções de cada tabuleiro intermédio (depois da propagação) é
+    memorizado pelo seu hash de Zobrist, com a indicação de ser exato ou
+    apenas um mínimo (se a contagem tiver parado no limite), pelo que os
+    tabuleiros iguais a que se chega por caminhos diferentes só são
+    explorados uma vez. A procura é iterativa, com uma pilha explícita,
+    para não depender da profundidade máxima de recursão."""
+    choose = BRANCHING_POLICIES[policy]
+    weights = [0] * (2 * len(board))
+    board = board.copy()
+    trail = []
+    if not board.propagate(trail=trail):
+        return 0, 0
+    # hash do tabuleiro -> (soluções, exata)
+    memo = {}
+    nodes = 0
+    # Cada elemento da pilha é uma posição em exploração: [hash, linha,
+    # coluna, valores, próximo valor, soluções, exata, comprimento do
+    # trilho, limite].
+    stack = []
+
+    def enter(limit):
+        """Devolve (soluções, exata) do tabuleiro atual se for imediato,
+        ou None depois de empilhar a posição onde ramificar."""
+        nonlocal nodes
+        if not board.empties:
+            return (0 if board.duplicate else 1), True
+        cached = memo.get(board.hash)
+        if cached and (cached[1] or (limit is not None and cached[0] >= limit)):
+            return cached
+        nodes += 1
+        i, j, values = choose(board, weights)
+        stack.append([board.hash, i, j, values, 0, 0, True, len(trail), limit])
+        return None
+
+    result = enter(limit)
+    while stack:
+        if max_nodes is not None and nodes > max_nodes:
+            return None, nodes
+        frame = stack[-1]
+        key, i, j, values, index, total, exact, length, frame_limit = frame
+        if index < len(values) and (frame_limit is None or total < frame_limit):
+            frame[4] += 1
+            if board.play(i, j, values[index], trail=trail):
+                sub_limit = None if frame_limit is None else frame_limit - total
+                result = enter(sub_limit)
+                if result is None:
+                    continue
+                frame[5] += result[0]
+                frame[6] = exact and result[1]
+            else:
+                weights[board.conflict_line] += 1
+            board.undo(trail, length)
+            continue
+
+        # Todos os valores explorados, ou limite atingido.
+        result = total, exact and index == len(values)
+        memo[key] = result
+        stack.pop()
+        if stack:
+            parent = stack[-1]
+            parent[5] += result[0]
+            parent[6] = parent[6] and result[1]
+            board.undo(trail, parent[7])
+
+    count = result[0]
+    return (min(count, limit) if limit is not None else count), nodes
+
+
+def raise_timeout(signum, frame):
+    raise TimeoutError
+
+
+# Cache de resultados de cada processo do conjunto de trabalhadores,
+# aberta uma única vez por open_worker_cache.
+worker_cache = None
+
+
+def open_worker_cache(path: str, cache_size=CACHE_SIZE):
+    """Inicializador dos processos de solve_batch: abre a cache de
+    resultados que solve_chunk usa em todos os blocos do processo."""
+    global worker_cache
+    worker_cache = ResultCache(path, cache_size)
+
+
+def solve_chunk(chunk, timeout=None, solver="tree", policy="completions"):
+    """Resolve uma lista de pares (etiqueta, tabuleiro) num processo do
+    conjunto de trabalhadores, com o método e a política dados, e com a
+    cache de resultados do processo, se aberta (ver open_worker_cache e
+    cached_solve). Devolve, para cada tabuleiro, um tuplo (etiqueta,
+    estado, solução, segundos), em que o estado é "ok", "cached",
+    "unsolvable" ou "timeout". O tempo limite (em segundos) é aplicado a
+    cada tabuleiro com um alarme do sistema."""
+    results = []
+    cache = worker_cache
+    for label, board in chunk:
+        start = time.perf_counter()
+        if timeout:
+            signal.signal(signal.SIGALRM, raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            if cache is not None:
+                solution, nodes = cached_solve(board, cache, solver, policy)
+            else:
+                solution, nodes = solve(board, solver, policy)
+            status = (
+                "unsolvable"
+                if not solution
+                else "ok" if nodes is not None else "cached"
+            )
+        except TimeoutError:
+            solution, status = None, "timeout"
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        results.append(
+            (label, status, solution and str(solution), time.perf_counter() - start)
+        )
+
+    return results
+
+
+def count_chunk(chunk, timeout=None, limit=None, policy="completions"):
+    """Conta as soluções (até limit) de uma lista de pares (etiqueta,
+    tabuleiro) num processo do conjunto de trabalhadores. Devolve, para
+    cada tabuleiro, um tuplo (etiqueta, estado, soluções, segundos), em
+    que o estado é "ok" ou "timeout" (e soluções é None)."""
+    results = []
+    for label, board in chunk:
+        start = time.perf_counter()
+        if timeout:
+            signal.signal(signal.SIGALRM, raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            count, _ = count_solutions(board, limit, policy)
+            status = "ok"
+        except TimeoutError:
+            count, status = None, "timeout"
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        results.append((label, status, count, time.perf_counter() - start))
+
+    return results
+
+
+def chunked(iterable, size: int):
+    """Agrupa os elementos do iterável em listas com size elementos."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def solve_batch(
+    boards,
+    workers=None,
+    chunksize=1,
+    ordered=True,
+    timeout=None,
+    solver="tree",
+    policy="completions",
+    count=None,
+    cache=None,
+    cache_size=CACHE_SIZE,
+):
+    """Resolve os pares (etiqueta, tabuleiro) dados num conjunto de
+    processos e devolve os resultados de solve_chunk à medida que ficam
+    prontos, pela ordem de entrada (ordered) ou de conclusão, com a cache
+    de resultados no ficheiro cache, se dado. Se count não for None, conta
+    as soluções de cada tabuleiro até esse limite (0 para contar todas) e
+    devolve os resultados de count_chunk.
+
+    Os tabuleiros são enviados em blocos de chunksize e só há alguns
+    blocos pendentes de cada vez, para que a entrada possa ser lida de
+    forma incremental."""
+    workers = workers or os.cpu_count()
+    initializer = initargs = None
+    if count is None:
+        task, arguments = solve_chunk, (timeout, solver, policy)
+        if cache:
+            initializer, initargs = open_worker_cache, (cache, cache_size)
+    else:
+        task, arguments = count_chunk, (timeout, count or None, policy)
+    chunks = chunked(boards, chunksize)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs or ()
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(task, chunk, *arguments))
+            if len(pending) < 2 * workers:
+                continue
+            if ordered:
+                yield from pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+        if ordered:
+            for future in pending:
+                yield from future.result()
+        else:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+
+
+def input_paths(inputs):
+    """Expande a lista de ficheiros, diretorias e padrões glob dados na
+    lista ordenada dos ficheiros de entrada ("-" é o standard input).
+    De uma diretoria são lidos os ficheiros cujo nome começa por "input",
+    como em tests/."""
+    for entry in inputs:
+        if entry == "-":
+            yield entry
+        elif os.path.isdir(entry):
+            yield from sorted(
+                path
+                for path in glob.glob(os.path.join(entry, "input*"))
+                if os.path.isfile(path)
+            )
+        elif os.path.exists(entry):
+            yield entry
+        else:
+            yield from sorted(glob.glob(entry))
+
+
+def labelled_instances(inputs):
+    """Gerador de pares (etiqueta, tabuleiro) para todas as instâncias dos
+    ficheiros de entrada. A etiqueta é "ficheiro:k" para a k-ésima
+    instância do ficheiro. Um ficheiro com uma instância mal formada (ver
+    Board.parse_instances) é assinalado no stderr e o resto desse ficheiro
+    é ignorado, continuando nos ficheiros seguintes."""
+    for path in input_paths(inputs):
+        if path == "-":
+            path, boards = "<stdin>", Board.parse_instances(sys.stdin.buffer)
+        else:
+            boards = Board.parse_file(path)
+        try:
+            for k, board in enumerate(boards, 1):
+                yield f"{path}:{k}", board
+        except ValueError as error:
+            print(f"{path}: {error}", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -441,7 +1952,137 @@ if __name__ == "__main__":
     # Usar uma técnica de procura para resolver a instância,
     # Retirar a solução a partir do nó resultante,
     # Imprimir para o standard output no formato indicado.
-    board = Board.parse_instance_from_stdin()
-    problem = Takuzu(board)
-    goal_node = depth_first_tree_search(problem)
-    print(goal_node.state.board)
+    parser = argparse.ArgumentParser(description="Resolve instâncias de Takuzu.")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="ficheiros, diretorias ou padrões glob com instâncias a resolver "
+        "em lote ('-' é o standard input)",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=list(SOLVERS),
+        default="tree",
+        help="método de procura (tree: depth_first_tree_search; trail: procura "
+        "em profundidade sobre um único tabuleiro com trilho de desfazer; cbj: "
+        "como trail, com retrocesso dirigido por conflitos e nogoods; sat: "
+        "codificação CNF e solver CDCL de sat.py; rows: procura linha a linha "
+        f"sobre as linhas válidas de patterns.py, até N = {MAX_PATTERN_SIZE}, "
+        "e trail acima disso)",
+    )
+    parser.add_argument(
+        "--policy",
+        choices=list(BRANCHING_POLICIES),
+        default="completions",
+        help="política de escolha da posição onde ramificar",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="escreve no stderr o número de nós expandidos",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="resolve em lote todas as instâncias do standard input",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="número de processos (por omissão, CPUs)"
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=1, help="instâncias enviadas por tarefa"
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="escreve os resultados pela ordem de conclusão",
+    )
+    parser.add_argument(
+        "--timeout", type=float, help="tempo limite por instância, em segundos"
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        metavar="LIMIT",
+        help="conta as soluções em vez de resolver, parando em LIMIT (0 para "
+        "contar todas; 2 verifica se a solução é única)",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="cache persistente (SQLite) das soluções, indexada pela forma "
+        "canónica do tabuleiro",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help="número máximo de entradas da cache",
+    )
+    args = parser.parse_args()
+
+    if args.count is not None and not (args.inputs or args.batch):
+        try:
+            board = Board.parse_instance_from_stdin()
+        except ValueError as error:
+            sys.exit(f"<stdin>: {error}")
+        start = time.perf_counter()
+        count, nodes_expanded = count_solutions(board, args.count or None, args.policy)
+        capped = args.count and count >= args.count
+        print(f"{count}+" if capped else count)
+        if args.stats:
+            print(
+                f"nós expandidos: {nodes_expanded} "
+                f"segundos: {time.perf_counter() - start:.3f}",
+                file=sys.stderr,
+            )
+        sys.exit()
+
+    if args.inputs or args.batch:
+        # Cada resultado é escrito como "# etiqueta estado segundos",
+        # seguido da solução no formato de entrada (N e as N linhas).
+        results = solve_batch(
+            labelled_instances(args.inputs or ["-"]),
+            workers=args.workers,
+            chunksize=args.chunksize,
+            ordered=not args.unordered,
+            timeout=args.timeout,
+            solver=args.solver,
+            policy=args.policy,
+            count=args.count,
+            cache=args.cache,
+            cache_size=args.cache_size,
+        )
+        for label, status, solution, seconds in results:
+            if args.count is not None:
+                # Em modo de contagem, "# etiqueta soluções segundos", em
+                # que soluções é "LIMIT+" se a contagem parou no limite.
+                if status == "ok":
+                    capped = args.count and solution >= args.count
+                    status = f"{solution}+" if capped else str(solution)
+                print(f"# {label} {status} {seconds:.3f}")
+                continue
+            print(f"# {label} {status} {seconds:.3f}")
+            if solution:
+                print(solution.count("\n") + 1)
+                print(solution)
+            sys.stdout.flush()
+        sys.exit()
+
+    try:
+        board = Board.parse_instance_from_stdin()
+    except ValueError as error:
+        sys.exit(f"<stdin>: {error}")
+    if args.cache:
+        with ResultCache(args.cache, args.cache_size) as cache:
+            solution, nodes_expanded = cached_solve(
+                board, cache, args.solver, args.policy
+            )
+    else:
+        solution, nodes_expanded = solve(board, args.solver, args.policy)
+    print(solution)
+    if args.stats:
+        if nodes_expanded is None:
+            print("solução da cache", file=sys.stderr)
+        else:
+            print(f"nós expandidos: {nodes_expanded}", file=sys.stderr)
@@ -5,6 +5,7 @@ import collections
 import collections.abc
 import functools
 import heapq
+import itertools
 import operator
 import os.path
 import random
@@ -724,10 +725,18 @@ class PriorityQueue:
     order) is returned first.
     If order is 'min', the item with minimum f(x) is
     returned first; if order is 'max', then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+    Items must be hashable: a dict maps each item to its heap entry, so
+    lookups are O(1) and deletions are lazy (the entry is marked as removed
+    and skipped when it reaches the top of the heap). Ties are broken by
+    insertion order."""
+
+    REMOVED = object()  # placeholder for a deleted item
 
     def __init__(self, order='min', f=lambda x: x):
         self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
         if order == 'min':
             self.f = f
         elif order == 'max':  # now item with max f(x)
@@ -736,8 +745,13 @@ class PriorityQueue:
             raise ValueError("Order must be either 'min' or 'max'.")
 
     def append(self, item):
-        """Insert item at its correct position."""
-        heapq.heappush(self.heap, (self.f(item), item))
+        """Insert item at its correct position. If the item is already in
+        the queue, its previous entry is replaced."""
+        if item in self.entries:
+            self.entries.pop(item)[-1] = self.REMOVED
+        entry = [self.f(item), next(self.counter), item]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -747,34 +761,35 @@ class PriorityQueue:
     def pop(self):
         """Pop and return the item (with min or max f(x) value)
         depending on the order."""
-        if self.heap:
-            return heapq.heappop(self.heap)[1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        while self.heap:
+            item = heapq.heappop(self.heap)[-1]
+            if item is not self.REMOVED:
+                del self.entries[item]
+                return item
+        raise Exception('Trying to pop from empty PriorityQueue.')
 
     def __len__(self):
         """Return current capacity of PriorityQueue."""
-        return len(self.heap)
+        return len(self.entries)
 
     def __contains__(self, key):
         """Return True if the key is in PriorityQueue."""
-        return any([item == key for _, item in self.heap])
+        return key in self.entries
 
     def __getitem__(self, key):
-        """Returns the first value associated with key in PriorityQueue.
+        """Returns the value associated with key in PriorityQueue.
         Raises KeyError if key is not present."""
-        for value, item in self.heap:
-            if item == key:
-                return value
-        raise KeyError(str(key) + " is not in the priority queue")
+        try:
+            return self.entries[key][0]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
 
     def __delitem__(self, key):
-        """Delete the first occurrence of key."""
+        """Delete key, leaving its heap entry to be skipped by pop."""
         try:
-            del self.heap[[item == key for _, item in self.heap].index(True)]
-        except ValueError:
+            self.entries.pop(key)[-1] = self.REMOVED
+        except KeyError:
             raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
 
 
 # ______________________________________________________________________________